@@ -9,8 +9,13 @@ https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ackbas.settings')
 
-application = get_asgi_application()
+# like django.core.asgi.get_asgi_application, but with the handler that streams async content from the event loop
+django.setup(set_prefix=False)
+
+from ackbas_core.async_streaming import RTASGIHandler  # noqa: E402
+
+application = RTASGIHandler()
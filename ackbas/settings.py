@@ -166,6 +166,43 @@ LOGGING = {
 }
 
 
+# Upper bounds for a single solution search, requests can only ask for lower limits (see ackbas_core/views.py)
+SOLUTION_SEARCH_LIMITS = {
+    'max_method_instances': 10000,
+    'max_objects': 50000,
+    'max_depth': 100,
+    'timeout': 10.0,  # seconds
+}
+
+# Processes a single solution search explores its branches with (see ackbas_core.solution_sketch.flood_fill),
+# 1 searches in the process handling the request. With more, the limits of SOLUTION_SEARCH_LIMITS are split between
+# the branches, so a search stopped by a limit can keep fewer solutions than with 1, and objects and methods are
+# named differently than with 1, but the same for any number above 1.
+SOLUTION_SEARCH_WORKERS = 1
+
+# Process pool the solution view (/s) runs searches in, so a long search does not block the server process.
+# Requests beyond workers + max_queue and searches not done after timeout seconds are answered with HTTP 503.
+# The pool belongs to a server process: under a WSGI server like the uwsgi of deployment/, every worker process has
+# its own pool, so the limits apply per worker and not to the whole server, and a worker still waits for each search
+# it hands to its pool and notices a disconnected client of /s/stream only once the search is done. Only ASGI
+# (ackbas/asgi.py, one server process) keeps the event loop free while searching and the limits server wide.
+SOLVER_POOL = {
+    'workers': 2,
+    'max_queue': 8,
+    'timeout': 15.0,  # seconds, more than the search timeout in SOLUTION_SEARCH_LIMITS
+}
+
+
+# Cache for solution graphs, use 'ackbas_core.solution_cache.RTDjangoSolutionCache' to share results between workers
+# via a cache from CACHES (OPTIONS: alias, timeout). Set to None to disable caching.
+SOLUTION_CACHE = {
+    'BACKEND': 'ackbas_core.solution_cache.RTLocalSolutionCache',
+    'OPTIONS': {
+        'max_size': 256,
+    },
+}
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/3.0/topics/i18n/
 
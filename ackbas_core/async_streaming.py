@@ -0,0 +1,91 @@
+"""
+Streaming responses with async content, which Django 3.1 only ever iterates synchronously
+"""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import contextvars
+from typing import AsyncGenerator, Iterator
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+from django.http import StreamingHttpResponse
+
+
+class RTAsyncStreamingHttpResponse(StreamingHttpResponse):
+    """
+    Streaming response with an async iterator as content. RTASGIHandler sends it from the event loop without blocking
+    it, WSGI servers and the test client iterate it in an event loop of their own.
+    """
+    def __init__(self, async_content: AsyncGenerator, *args, **kwargs):
+        self.async_content = async_content
+        super().__init__(RTAsyncStreamingHttpResponse.iterate_in_own_loop(async_content), *args, **kwargs)
+
+    @staticmethod
+    def iterate_in_own_loop(async_content: AsyncGenerator) -> Iterator:
+        loop = asyncio.new_event_loop()
+        try:
+            while True:
+                try:
+                    yield loop.run_until_complete(async_content.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            loop.run_until_complete(async_content.aclose())
+            loop.close()
+
+
+# receive of the ASGI connection the handler is currently serving, connections are served in tasks of their own
+_receive = contextvars.ContextVar('receive')
+
+
+class RTASGIHandler(ASGIHandler):
+    """
+    Django's ASGI handler, but responses with async content are streamed from the event loop and closed as soon as
+    the client disconnects, see RTAsyncStreamingHttpResponse
+    """
+    async def __call__(self, scope, receive, send):
+        _receive.set(receive)
+        await super().__call__(scope, receive, send)
+
+    async def send_response(self, response, send):
+        if not isinstance(response, RTAsyncStreamingHttpResponse):
+            await super().send_response(response, send)
+            return
+
+        response_headers = []
+        for header, value in response.items():
+            response_headers.append((header.encode('ascii'), value.encode('latin1')))
+        for cookie in response.cookies.values():
+            response_headers.append((b'Set-Cookie', cookie.output(header='').encode('ascii').strip()))
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': response_headers})
+
+        content = response.async_content
+        disconnect = asyncio.ensure_future(RTASGIHandler.wait_for_disconnect(_receive.get()))
+        try:
+            while True:
+                part = asyncio.ensure_future(content.__anext__())
+                await asyncio.wait({part, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+                if not part.done():
+                    # the content can only be closed once it is not running anymore
+                    part.cancel()
+                    with contextlib.suppress(asyncio.CancelledError, StopAsyncIteration):
+                        await part
+                    break
+                try:
+                    chunk = response.make_bytes(part.result())
+                except StopAsyncIteration:
+                    await send({'type': 'http.response.body'})
+                    break
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            disconnect.cancel()
+            await content.aclose()
+        await sync_to_async(response.close, thread_sensitive=True)()
+
+    @staticmethod
+    async def wait_for_disconnect(receive):
+        # the request body has been read already, so the only message left to come is the disconnect
+        while (await receive())['type'] != 'http.disconnect':
+            pass
@@ -0,0 +1,206 @@
+"""
+Benchmarks for the solution search, run from the repository root with `python -m ackbas_core.benchmark`
+"""
+from __future__ import annotations
+
+import random
+import time
+import tracemalloc
+from typing import List, Dict
+
+from ackbas_core.knowledge_graph import RTGraph, RTMethodInput
+from ackbas_core.solution_sketch import RTObjectInstance, RTMethodInstance, RTSolutionGraph, RTSearchOptions, \
+    flood_fill, object_matches_input_spec, RTParamMatrix, numpy, SEARCH_STRATEGIES
+
+
+def bench_propagation_chain(graph: RTGraph, length: int) -> float:
+    """
+    Build a chain of method instances one by one, propagating each new method like the search does.
+    Returns the elapsed time in seconds.
+    """
+    method = graph.methods["Useless"]
+    output_type = method.outputs["optionOne"]["objectOne"].type
+
+    start_time = time.perf_counter()
+
+    obj = RTObjectInstance("o0", graph.types["TypeOne"], {}, {"ValueOne": 1}, None)
+    for i in range(1, length + 1):
+        new_obj = RTObjectInstance("o" + str(i), output_type, {}, {}, None)
+        method_instance = RTMethodInstance(method, "m" + str(i), {"objectOne": obj}, {"optionOne": {"objectOne": new_obj}})
+        method_instance.propagate()
+        new_obj.output_of = method_instance
+        obj = new_obj
+
+    return time.perf_counter() - start_time
+
+
+def run_propagation_benchmark(lengths: List[int]):
+    graph = RTGraph('minimal.yml')
+
+    print("propagation of method chains")
+    print(f"{'length':>8} {'total [ms]':>12} {'per method [us]':>16}")
+    for length in lengths:
+        elapsed = bench_propagation_chain(graph, length)
+        print(f"{length:>8} {elapsed * 1e3:>12.1f} {elapsed / length * 1e6:>16.2f}")
+
+
+def bench_input_matching(graph: RTGraph, n_objects: int, batch: bool) -> float:
+    """
+    Match objects with varying params against every input spec of their type, one by one or with a RTParamMatrix.
+    Returns the elapsed time in seconds.
+    """
+    type_def = graph.types["TypeTwo"]
+    enum_values = [graph.instantiate_param(graph.param_types["MyEnum"], val) for val in ("One", "Two")]
+    param_variants = [{}, {"ValueTwo": 3}, {"ValueTwo": 3, "ValueEnum": enum_values[0]}, {"ValueEnum": enum_values[1]}]
+    objects = [RTObjectInstance("o" + str(i), type_def, {}, param_variants[i % len(param_variants)], None)
+               for i in range(n_objects)]
+    input_specs = [input_spec for _, _, input_spec in graph.inputs_by_type[type_def.name]]
+
+    start_time = time.perf_counter()
+    if batch:
+        param_matrix = RTParamMatrix(objects)
+        for input_spec in input_specs:
+            param_matrix.matching(input_spec)
+    else:
+        for input_spec in input_specs:
+            [obj for obj in objects if object_matches_input_spec(obj, input_spec)]
+
+    return time.perf_counter() - start_time
+
+
+def run_matching_benchmark(object_counts: List[int]):
+    graph = RTGraph('minimal.yml')
+    n_specs = len(graph.inputs_by_type["TypeTwo"])
+    if numpy is None:
+        print("NumPy is not installed, the batch column matches one by one")
+
+    print("matching objects against input specs")
+    print(f"{'objects':>8} {'one by one [us]':>16} {'matrix [us]':>12}")
+    for n_objects in object_counts:
+        one_by_one = bench_input_matching(graph, n_objects, batch=False) / (n_objects * n_specs)
+        batch = bench_input_matching(graph, n_objects, batch=True) / (n_objects * n_specs)
+        print(f"{n_objects:>8} {one_by_one * 1e6:>16.3f} {batch * 1e6:>12.3f}")
+
+
+def bench_choice_space_queries(graph: RTGraph, depth: int, n_objects: int = 500, n_queries: int = 100) -> float:
+    """
+    Query objects and redundancy in a solution graph whose choice spaces have up to depth choices.
+    Returns the elapsed time per query in seconds.
+    """
+    type_def = graph.types["TypeTwo"]
+    rng = random.Random(depth)
+    start_object = RTObjectInstance("start", type_def, {}, {}, None)
+    solution_graph = RTSolutionGraph([start_object], RTMethodInput(graph.types["TypeThree"], {}))
+    choice_spaces = []
+    for i in range(n_objects):
+        choice_space = {"m" + str(k): rng.choice(("optionGood", "optionBad")) for k in range(rng.randint(0, depth))}
+        choice_spaces.append(choice_space)
+        solution_graph.add_object(RTObjectInstance("o" + str(i), type_def, choice_space, {"ValueTwo": i % 7}, None))
+    queries = [RTObjectInstance("q" + str(i), type_def, choice_space, {"ValueTwo": 3}, None)
+               for i, choice_space in enumerate(choice_spaces[:n_queries])]
+
+    start_time = time.perf_counter()
+    for query in queries:
+        solution_graph.get_objects_in_choice_space(query.choice_space, type_def)
+        solution_graph.is_redundant(query, query.choice_space)
+
+    return (time.perf_counter() - start_time) / n_queries
+
+
+def run_choice_space_benchmark(depths: List[int]):
+    graph = RTGraph('minimal.yml')
+
+    print("choice space queries")
+    print(f"{'depth':>8} {'per query [us]':>15}")
+    for depth in depths:
+        print(f"{depth:>8} {bench_choice_space_queries(graph, depth) * 1e6:>15.1f}")
+
+
+def bench_search_strategy(graph: RTGraph, strategy: str, start_type: str, start_params: Dict[str, str],
+                          target_type: str):
+    """
+    Search with the given strategy and prune the solution graph.
+    Returns the elapsed time in seconds, the number of method instances created and kept.
+    """
+    start_type_def = graph.types[start_type]
+    start_param_values = {
+        param_name: graph.instantiate_param(start_type_def.params[param_name].type, param_val)
+        for param_name, param_val in start_params.items()
+    }
+
+    start_time = time.perf_counter()
+    start_object = RTObjectInstance('start', start_type_def, {}, start_param_values, None)
+    solution_graph = RTSolutionGraph([start_object], RTMethodInput(graph.types[target_type], {}))
+    SEARCH_STRATEGIES[strategy](solution_graph, graph, {}, [start_object], RTSearchOptions(strategy=strategy))
+    elapsed = time.perf_counter() - start_time
+    n_created = len(solution_graph.method_instances)
+    solution_graph.prune()
+
+    return elapsed, n_created, len(solution_graph.method_instances)
+
+
+def run_strategy_benchmark():
+    graph = RTGraph('new_types.yml')
+    queries = [
+        ('DGL', {'Linear': 'NichtLinear'}, 'Trajektorienfolgeregler'),
+        ('DGL', {'Linear': 'Linear'}, 'Sprungantwort'),
+    ]
+
+    print("search strategies on new_types.yml")
+    print(f"{'query':>40} {'strategy':>11} {'time [ms]':>10} {'created':>8} {'kept':>6}")
+    for start_type, start_params, target_type in queries:
+        query = f"{start_type} -> {target_type}"
+        for strategy in SEARCH_STRATEGIES:
+            elapsed, n_created, n_kept = bench_search_strategy(graph, strategy, start_type, start_params, target_type)
+            print(f"{query:>40} {strategy:>11} {elapsed * 1e3:>10.1f} {n_created:>8} {n_kept:>6}")
+
+
+def bench_search_memory(graph: RTGraph, start_type: str, start_params: Dict[str, str], target_type: str):
+    """
+    Run an exhaustive search and measure the memory allocated for the solution graph.
+    Returns the solution graph and the allocated bytes.
+    """
+    start_type_def = graph.types[start_type]
+    start_param_values = {
+        param_name: graph.instantiate_param(start_type_def.params[param_name].type, param_val)
+        for param_name, param_val in start_params.items()
+    }
+
+    tracemalloc.start()
+    start_object = RTObjectInstance('start', start_type_def, {}, start_param_values, None)
+    solution_graph = RTSolutionGraph([start_object], RTMethodInput(graph.types[target_type], {}))
+    flood_fill(solution_graph, graph, {}, [start_object], RTSearchOptions(exhaustive=True))
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return solution_graph, allocated
+
+
+def run_memory_benchmark():
+    graph = RTGraph('new_types.yml')
+    queries = [
+        ('DGL', {'Linear': 'NichtLinear'}, 'Trajektorienfolgeregler'),
+        ('DGL', {'Linear': 'Linear'}, 'Sprungantwort'),
+        ('ÜTF', {}, 'PIDParameter'),
+    ]
+
+    print("memory of exhaustive searches on new_types.yml")
+    print(f"{'query':>40} {'objects':>8} {'methods':>8} {'total [kB]':>11} {'per object [B]':>15}")
+    for start_type, start_params, target_type in queries:
+        solution_graph, allocated = bench_search_memory(graph, start_type, start_params, target_type)
+        n_objects = len(solution_graph.object_instances)
+        n_methods = len(solution_graph.method_instances)
+        query = f"{start_type} -> {target_type}"
+        print(f"{query:>40} {n_objects:>8} {n_methods:>8} {allocated / 1e3:>11.1f} {allocated / n_objects:>15.0f}")
+
+
+if __name__ == '__main__':
+    run_propagation_benchmark([500, 1000, 2000, 4000, 8000])
+    print()
+    run_matching_benchmark([10, 100, 1000, 10000])
+    print()
+    run_choice_space_benchmark([4, 16, 64])
+    print()
+    run_strategy_benchmark()
+    print()
+    run_memory_benchmark()
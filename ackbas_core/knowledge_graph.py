@@ -1,9 +1,18 @@
 from __future__ import annotations
 
 import yaml
-from typing import List, Dict, Union, Optional
+from typing import List, Dict, Union, Optional, Tuple, FrozenSet
 import os
-from dataclasses import dataclass
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import hashlib
+import heapq
+import marshal
+import operator
+import struct
+import sys
+import tempfile
+import threading
 import jsonschema
 import json
 
@@ -24,10 +33,14 @@ class RTParamPlaceholder:
     def __repr__(self):
         return "$" + self.name
 
+    def __hash__(self):
+        return hash(self.name)
+
 
 @dataclass
 class RTParamUnset:
-    pass
+    def __hash__(self):
+        return hash(RTParamUnset)
 
 
 @dataclass
@@ -43,6 +56,21 @@ class RTEnumValue:
     def __repr__(self):
         return self.type.name + "." + self.type.values[self.val]
 
+    def __hash__(self):
+        return hash((self.type.name, self.val))
+
+
+def encode_param_value(val: RTParamValue) -> Union[int, RTParamValue]:
+    """
+    Integer code of a set param value, ints and enum values are mapped to even and odd codes so they never collide
+    """
+    if isinstance(val, RTEnumValue):
+        return 2 * val.val + 1
+    elif isinstance(val, int):
+        return 2 * val
+    # start objects can be given placeholders, these are rare enough to be compared as they are
+    return val
+
 
 @dataclass
 class RTParamDefinition:
@@ -50,11 +78,44 @@ class RTParamDefinition:
     type: RTParamType
 
 
+def display_yaml(yaml_source: Union[str, Dict]) -> str:
+    # display YML is only needed for tooltips, so it is generated from the parsed YML on first use
+    if isinstance(yaml_source, str):
+        return yaml_source
+    return yaml.dump(yaml_source, allow_unicode=True)
+
+
 @dataclass
 class RTTypeDefinition:
     name: str
     params: Dict[str, RTParamDefinition]
-    yaml: str
+    yaml_source: Union[str, Dict] = field(repr=False, compare=False)  # display YML or the parsed YML it is made from
+    # param name -> position in the param vectors of objects of this type, see encode_params
+    param_positions: Dict[str, int] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.param_positions = {param_name: i for i, param_name in enumerate(self.params)}
+
+    @property
+    def yaml(self) -> str:
+        self.yaml_source = display_yaml(self.yaml_source)
+        return self.yaml_source
+
+    def encode_params(self, param_values: Dict[str, RTParamValue]) -> Tuple[int, Tuple]:
+        """
+        Encode param values as a bit mask of the set params and a vector of value codes, unset params have code 0.
+        Params the type does not define are left out, objects keep those copied from an input of another type.
+        """
+        mask = 0
+        vector = [0] * len(self.param_positions)
+        for param_name, param_val in param_values.items():
+            position = self.param_positions.get(param_name)
+            if position is None:
+                continue
+            mask |= 1 << position
+            vector[position] = encode_param_value(param_val)
+
+        return mask, tuple(vector)
 
 
 RTParamValue = Union[int, RTEnumValue, RTParamPlaceholder, RTParamUnset]
@@ -65,12 +126,58 @@ class RTMethodInput:
     type: RTTypeDefinition
     param_constraints: Dict[str, RTParamValue]
     tune: bool = False
+    # compiled constraints: bits of the params that have to be set or unset, positions and codes of required values
+    set_mask: int = field(init=False, repr=False, compare=False)
+    unset_mask: int = field(init=False, repr=False, compare=False)
+    value_positions: Tuple[int, ...] = field(init=False, repr=False, compare=False)
+    value_codes: Tuple[int, ...] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.set_mask = 0
+        self.unset_mask = 0
+        value_positions = []
+        value_codes = []
+        for param_name, constraint in self.param_constraints.items():
+            position = self.type.param_positions[param_name]
+            if isinstance(constraint, RTParamPlaceholder):
+                continue  # any value, or none at all
+            elif isinstance(constraint, RTParamUnset):
+                self.unset_mask |= 1 << position
+            else:
+                self.set_mask |= 1 << position
+                value_positions.append(position)
+                value_codes.append(encode_param_value(constraint))
+
+        self.value_positions = tuple(value_positions)
+        self.value_codes = tuple(value_codes)
+        # itemgetter returns a single item instead of a tuple for one position, the codes are compared in the same shape
+        self._select_values = operator.itemgetter(*value_positions) if value_positions else None
+        self._selected_codes = value_codes[0] if len(value_codes) == 1 else tuple(value_codes)
+
+    def matches_params(self, mask: int, vector: Tuple[int, ...]) -> bool:
+        """
+        Check the param constraints against params encoded with RTTypeDefinition.encode_params
+        """
+        if mask & self.unset_mask or mask & self.set_mask != self.set_mask:
+            return False
+        return self._select_values is None or self._select_values(vector) == self._selected_codes
+
+
+@dataclass
+class RTParamBinding:
+    """
+    Compiled rule for setting one output param: either a literal value or the first available source param
+    """
+    param_name: str
+    literal: Optional[Union[int, RTEnumValue]] = None
+    sources: List[Tuple[str, str]] = field(default_factory=list)  # (input name, input param name) candidates
 
 
 @dataclass
 class RTMethodOutput:
     type: RTTypeDefinition
     param_statements: Dict[str, RTParamValue]  # does not support integer expressions
+    param_bindings: List[RTParamBinding] = field(default_factory=list)
 
 
 @dataclass
@@ -78,30 +185,199 @@ class RTMethod:
     name: str
     inputs: Dict[str, RTMethodInput]
     outputs: Dict[str, Dict[str, RTMethodOutput]]
-    yaml: str
+    yaml_source: Union[str, Dict] = field(repr=False, compare=False)  # display YML or the parsed YML it is made from
     description: Optional[str] = None
+    cost: float = 1  # used by the best first search, e.g. the effort of carrying out the method
+
+    @property
+    def yaml(self) -> str:
+        self.yaml_source = display_yaml(self.yaml_source)
+        return self.yaml_source
+
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), 'knowledge_graph.schema.json')
+
+_schema_validator = None
+_validated_hashes = set()  # content hashes of graphs that passed validation in this process
+_validation_lock = threading.Lock()
+
+
+def get_schema_validator():
+    """
+    Return the validator for the knowledge graph schema, the schema is only loaded and checked once per process
+    """
+    global _schema_validator
+    with _validation_lock:
+        if _schema_validator is None:
+            with open(SCHEMA_PATH, 'r', encoding='utf8') as f:
+                schema = json.load(f)
+
+            validator_class = jsonschema.validators.validator_for(schema)
+            validator_class.check_schema(schema)
+            _schema_validator = validator_class(schema)
+
+        return _schema_validator
+
+
+def validate_graph_content(yaml_content, content_hash: str, trusted: bool = False):
+    """
+    Validate parsed YML based on the JSON schema. In trusted mode, contents that already passed are not checked again.
+    """
+    if trusted and content_hash in _validated_hashes:
+        return
+
+    error = jsonschema.exceptions.best_match(get_schema_validator().iter_errors(yaml_content))
+    if error is not None:
+        raise error
+
+    with _validation_lock:
+        _validated_hashes.add(content_hash)
+
+
+# Compiled knowledge graphs are stored next to the YML file as header + marshal data (plain dicts, lists and strings).
+# They cache the parsed YML and the display strings, RTGraph still builds its types, methods and indexes from them,
+# which is cheap compared to parsing the YML.
+# The header contains the Python version because the marshal format may change between versions, and the length of
+# the marshal data to detect truncated files.
+# marshal is not safe against maliciously crafted data, only load compiled files produced locally by compile_graph.
+COMPILED_EXTENSION = '.mkg'
+COMPILED_MAGIC = b'MNKG'
+COMPILED_FORMAT_VERSION = 2
+COMPILED_HEADER_FORMAT = '<HHBBQ'
+
+
+class RTCompiledGraphError(Exception):
+    """
+    Raised for a compiled graph that is damaged or was written by another format or Python version
+    """
+    pass
+
+
+def compiled_path_for(yml_path: str) -> str:
+    return os.path.splitext(yml_path)[0] + COMPILED_EXTENSION
+
+
+def compiled_header(data_length: int) -> bytes:
+    return COMPILED_MAGIC + struct.pack(COMPILED_HEADER_FORMAT, COMPILED_FORMAT_VERSION, marshal.version,
+                                        *sys.version_info[:2], data_length)
+
+
+def compile_graph(yml_path: str, output_path: Optional[str] = None) -> str:
+    """
+    Validate the YML file and write the compiled graph, returns the path of the compiled file
+    """
+    if output_path is None:
+        output_path = compiled_path_for(yml_path)
+
+    # fully load the graph once to report all errors before anything is written
+    graph = RTGraph(yml_path, use_compiled=False)
+
+    with open(yml_path, 'r', encoding='utf8') as f:
+        yaml_content = yaml.load(f, Loader=yaml.SafeLoader)
+
+    write_compiled_graph(graph, yaml_content, output_path)
+
+    return output_path
+
+
+def write_compiled_graph(graph: RTGraph, yaml_content: Dict, output_path: str):
+    """
+    Write the compiled file for a graph loaded from the given, already validated YML content
+    """
+    data = marshal.dumps({
+        'source_hash': graph.content_hash,
+        'content': yaml_content,
+        'type_yaml': {type_name: type_def.yaml for type_name, type_def in graph.types.items()},
+        'method_yaml': {method_name: method.yaml for method_name, method in graph.methods.items()}
+    })
+
+    # write to a temporary file of its own first, so readers never see a partially written file and processes
+    # compiling the same graph at once do not write into each other's file
+    directory, file_name = os.path.split(output_path)
+    with tempfile.NamedTemporaryFile('wb', dir=directory or '.', prefix=file_name + '.', suffix='.tmp',
+                                     delete=False) as f:
+        tmp_path = f.name
+        try:
+            f.write(compiled_header(len(data)))
+            f.write(data)
+        except BaseException:
+            f.close()
+            os.unlink(tmp_path)
+            raise
+    os.replace(tmp_path, output_path)
+
+
+def load_compiled_graph(compiled_path: str, source_hash: str) -> Optional[Dict]:
+    """
+    Read a compiled graph, None if there is none or it was compiled from different contents.
+    Raises RTCompiledGraphError if the file is damaged or written by another format or Python version.
+    """
+    if not os.path.exists(compiled_path):
+        return None
+
+    with open(compiled_path, 'rb') as f:
+        content = f.read()
+
+    header_length = len(compiled_header(0))
+    if len(content) < header_length or content[:len(COMPILED_MAGIC)] != COMPILED_MAGIC:
+        raise RTCompiledGraphError(f"{compiled_path} is not a compiled graph")
+    header = content[:header_length]
+    data_length = struct.unpack(COMPILED_HEADER_FORMAT, header[len(COMPILED_MAGIC):])[-1]
+    if header != compiled_header(data_length):
+        raise RTCompiledGraphError(f"{compiled_path} was compiled by another format or Python version")
+    if len(content) - header_length != data_length:
+        raise RTCompiledGraphError(f"{compiled_path} is truncated")
+
+    try:
+        data = marshal.loads(content[header_length:])
+    except (EOFError, ValueError, TypeError) as e:
+        raise RTCompiledGraphError(f"{compiled_path} is damaged: {e}")
+    if not isinstance(data, dict) or not all(isinstance(data.get(key), dict)
+                                             for key in ('content', 'type_yaml', 'method_yaml')):
+        raise RTCompiledGraphError(f"{compiled_path} is damaged")
+
+    if data.get('source_hash') != source_hash:
+        return None
+
+    return data
 
 
 class RTGraph:
     """
     Core knowledge graph type
     """
-    def __init__(self, yml_path):
+    def __init__(self, yml_path, trusted: bool = False, use_compiled: bool = True):
         """
-        Load knowledge graph from YML file
+        Load knowledge graph from YML file, with trusted=True validation is skipped for already validated contents.
+        If an up to date compiled graph exists next to the file (see compile_graph), the parsed YML is taken from it.
+        A damaged compiled file is replaced.
         """
         self.node_id = 1
 
-        with open(yml_path, 'r', encoding='utf8') as f:
-            yaml_content = yaml.load(f, Loader=yaml.SafeLoader)
-
-        schema_path = os.path.join(os.path.dirname(__file__), 'knowledge_graph.schema.json')
-
-        with open(schema_path, 'r', encoding='utf8') as f:
-            schema = json.load(f)
+        with open(yml_path, 'rb') as f:
+            raw_content = f.read()
+
+        # identifies the graph contents independent of the path it was loaded from
+        self.content_hash = hashlib.sha256(raw_content).hexdigest()
+
+        compiled = None
+        recompile = False  # replace a damaged compiled file once the graph is loaded from the YML
+        if use_compiled:
+            try:
+                compiled = load_compiled_graph(compiled_path_for(yml_path), self.content_hash)
+            except RTCompiledGraphError:
+                recompile = True
+
+        if compiled is not None:
+            yaml_content = compiled['content']
+            # the contents were validated when compiling, but the compiled file may have been replaced since, so
+            # only contents this process validated itself are trusted
+            validate_graph_content(yaml_content, self.content_hash, trusted=trusted)
+        else:
+            yaml_content = yaml.load(raw_content.decode('utf8'), Loader=yaml.SafeLoader)
 
-        # Validate YML based on JSON schema
-        jsonschema.validate(yaml_content, schema)
+            # Validate YML based on JSON schema
+            validate_graph_content(yaml_content, self.content_hash, trusted=trusted)
 
         # Instantiate objects to build graph in memory
         self.param_types: Dict[str, RTParamType] = {
@@ -122,7 +398,8 @@ class RTGraph:
                     param_type = self.param_types[param_type_name]
                     type_params[param_name] = RTParamDefinition(param_name, param_type)
 
-            self.types[type_name] = RTTypeDefinition(type_name, type_params, yaml.dump(type_yaml, allow_unicode=True))
+            type_yaml_source = compiled['type_yaml'][type_name] if compiled is not None else type_yaml
+            self.types[type_name] = RTTypeDefinition(type_name, type_params, type_yaml_source)
 
         self.methods: Dict[str, RTMethod] = {}
         for method_name, method_yaml in yaml_content['methods'].items():
@@ -147,17 +424,144 @@ class RTGraph:
                         for param_name, param_val in output_yaml['params'].items():
                             param_statements[param_name] = self.instantiate_param(type_def.params[param_name].type, param_val)
 
-                    option_dict[output_name] = RTMethodOutput(type_def, param_statements)
+                    param_bindings = self.compile_param_bindings(method_name, output_name, inputs, param_statements)
+                    option_dict[output_name] = RTMethodOutput(type_def, param_statements, param_bindings)
                 outputs[output_option] = option_dict
 
             description = method_yaml.get('description', None)
+            cost = method_yaml.get('cost', 1)
+
+            method_yaml_source = compiled['method_yaml'][method_name] if compiled is not None else method_yaml
+            self.methods[method_name] = RTMethod(method_name, inputs, outputs, method_yaml_source, description=description,
+                                                 cost=cost)
+
+        # index which method inputs accept objects of a given type, so the search only visits candidate methods
+        self.inputs_by_type: Dict[str, List[Tuple[RTMethod, str, RTMethodInput]]] = {type_name: [] for type_name in self.types}
+        for method in self.methods.values():
+            for input_name, input_def in method.inputs.items():
+                if input_def.tune:
+                    continue
+                self.inputs_by_type[input_def.type.name].append((method, input_name, input_def))
+
+        # and which methods produce objects of a given type, each method listed once per type
+        self.methods_by_output_type: Dict[str, List[RTMethod]] = {type_name: [] for type_name in self.types}
+        for method in self.methods.values():
+            for output_type_name in dict.fromkeys(output_def.type.name
+                                                  for output_option in method.outputs.values()
+                                                  for output_def in output_option.values()):
+                self.methods_by_output_type[output_type_name].append(method)
+
+        # type level reachability: target type name -> {type name: minimal cost of the methods to get to the target}
+        # and target type name -> names of methods with an output that can lead to the target
+        self.type_distances: Dict[str, Dict[str, float]] = {}
+        self.methods_reaching: Dict[str, FrozenSet[str]] = {}
+        for type_name in self.types:
+            distances = self.compute_type_distances(type_name)
+            self.type_distances[type_name] = distances
+            self.methods_reaching[type_name] = frozenset(
+                method.name
+                for reaching_type_name in distances
+                for method in self.methods_by_output_type[reaching_type_name])
+
+        if recompile:
+            try:
+                write_compiled_graph(self, yaml_content, compiled_path_for(yml_path))
+            except OSError:
+                pass  # e.g. a read-only directory, the YML is parsed on every load until the file is replaced
+
+    def compute_type_distances(self, target_type_name: str) -> Dict[str, float]:
+        """
+        Cheapest method costs backwards from the target type (the number of methods if no costs are given), ignoring
+        params and counting a method as applicable as soon as one of its inputs is available.
+        The distances are therefore lower bounds of the cost still needed to get from an object to the target.
+        """
+        distances = {target_type_name: 0}
+        frontier = [(0, target_type_name)]
+        while frontier:
+            distance, type_name = heapq.heappop(frontier)
+            if distance > distances[type_name]:
+                continue  # already reached cheaper
+
+            for method in self.methods_by_output_type[type_name]:
+                input_distance = distance + method.cost
+                for input_def in method.inputs.values():
+                    if input_def.tune or input_distance >= distances.get(input_def.type.name, float('inf')):
+                        continue
+                    distances[input_def.type.name] = input_distance
+                    heapq.heappush(frontier, (input_distance, input_def.type.name))
+
+        return distances
+
+    def relevant_methods(self, target_spec: RTMethodInput, bidirectional: bool = False) -> FrozenSet[str]:
+        """
+        Names of the methods that can contribute to an object matching the target spec.
+        Without bidirectional, these are all methods with an output type that can reach the target type.
+        With bidirectional, the method specs are followed backwards from the target spec instead, which also rules out
+        methods whose outputs have literal params conflicting with the spec they would have to fill.
+        """
+        if not bidirectional:
+            return self.methods_reaching[target_spec.type.name]
+
+        relevant = set()
+        specs = [target_spec]
+        while specs:
+            spec = specs.pop()
+            for method in self.methods_by_output_type[spec.type.name]:
+                if method.name in relevant:
+                    continue  # inputs are already queued
+
+                if not any(output_def.type.name == spec.type.name and self.output_may_match(output_def, spec)
+                           for output_option in method.outputs.values()
+                           for output_def in output_option.values()):
+                    continue
+
+                relevant.add(method.name)
+                specs.extend(input_def for input_def in method.inputs.values() if not input_def.tune)
+
+        return frozenset(relevant)
+
+    @staticmethod
+    def output_may_match(output_def: RTMethodOutput, spec: RTMethodInput) -> bool:
+        """
+        False if the literal params of an output rule out that its objects match the spec
+        """
+        for param_name, constraint in spec.param_constraints.items():
+            statement = output_def.param_statements.get(param_name, None)
+            if not (isinstance(statement, int) or isinstance(statement, RTEnumValue)):
+                continue  # the value depends on the inputs
+
+            if isinstance(constraint, RTParamUnset):
+                return False
+            if (isinstance(constraint, int) or isinstance(constraint, RTEnumValue)) and statement != constraint:
+                return False
 
-            self.methods[method_name] = RTMethod(method_name, inputs, outputs, yaml.dump(method_yaml, allow_unicode=True), description=description)
+        return True
 
     def next_id(self):
         self.node_id += 1
         return self.node_id - 1
 
+    @staticmethod
+    def compile_param_bindings(method_name: str, output_name: str, inputs: Dict[str, RTMethodInput],
+                               param_statements: Dict[str, RTParamValue]) -> List[RTParamBinding]:
+        """
+        Resolve the param statements of an output to literals or the input params with a matching placeholder
+        """
+        bindings = []
+        for param_name, param_statement in param_statements.items():
+            if isinstance(param_statement, int) or isinstance(param_statement, RTEnumValue):
+                bindings.append(RTParamBinding(param_name, literal=param_statement))
+            elif isinstance(param_statement, RTParamPlaceholder):
+                sources = [(input_name, in_param_name)
+                           for input_name, input_def in inputs.items()
+                           for in_param_name, param_constraint in input_def.param_constraints.items()
+                           if isinstance(param_constraint, RTParamPlaceholder) and param_constraint.name == param_statement.name]
+                if not sources:
+                    raise RTLoadError(f"Placeholder {param_statement} of {method_name}.{output_name} is not bound by any input")
+                bindings.append(RTParamBinding(param_name, sources=sources))
+
+        return bindings
+
     @staticmethod
     def instantiate_param(param_type: RTParamType, literal_val: Union[int, str]) -> RTParamValue:
         # the following matching should actually be done based on the expected type
@@ -179,6 +583,86 @@ class RTGraph:
             raise RTLoadError(literal_val + " of type " + type(literal_val) + " is not a valid constraint")
 
 
+class RTGraphRegistry:
+    """
+    Process-wide cache of loaded knowledge graphs, so the YML file is only parsed and validated again when it changes
+    """
+    def __init__(self, max_size: int = 16):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        # path -> (stat stamp, graph), ordered from least to most recently used
+        self._graphs: OrderedDict[str, Tuple[Tuple[int, int], RTGraph]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, yml_path: str) -> RTGraph:
+        """
+        Return the graph for the given file, loading it if it is not cached or the file changed on disk
+        """
+        path = os.path.abspath(yml_path)
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            if path in self._graphs:
+                cached_stamp, graph = self._graphs[path]
+                if cached_stamp == stamp or self._content_unchanged(path, graph):
+                    self._graphs[path] = (stamp, graph)
+                    self._graphs.move_to_end(path)
+                    self.hits += 1
+                    return graph
+
+                del self._graphs[path]
+
+            self.misses += 1
+
+        # load outside the lock, a concurrent miss for the same file at worst parses it twice
+        graph = RTGraph(path, trusted=True)
+
+        with self._lock:
+            self._graphs[path] = (stamp, graph)
+            self._graphs.move_to_end(path)
+            while len(self._graphs) > self.max_size:
+                self._graphs.popitem(last=False)
+
+        return graph
+
+    @staticmethod
+    def _content_unchanged(path: str, graph: RTGraph) -> bool:
+        # the file was touched, only reload if the contents actually differ
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest() == graph.content_hash
+
+    def invalidate(self, yml_path: Optional[str] = None):
+        """
+        Drop a single graph or, without argument, all graphs from the cache
+        """
+        with self._lock:
+            if yml_path is None:
+                self._graphs.clear()
+            else:
+                self._graphs.pop(os.path.abspath(yml_path), None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._graphs),
+                'max_size': self.max_size
+            }
+
+
+graph_registry = RTGraphRegistry()
+
+
+def load_graph(yml_path: str) -> RTGraph:
+    """
+    Return the cached knowledge graph for the given YML file
+    """
+    return graph_registry.get(yml_path)
+
+
 if __name__ == '__main__':
     graph = RTGraph('../new_types.yml')
     print(graph.methods)
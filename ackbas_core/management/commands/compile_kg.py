@@ -0,0 +1,26 @@
+import glob
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+import ackbas_core.knowledge_graph as kg
+
+
+class Command(BaseCommand):
+    help = "Store the parsed YML of knowledge graphs next to them for faster loading, the YML files stay the source format"
+
+    def add_arguments(self, parser):
+        parser.add_argument('yml_files', nargs='*',
+                            help="YML files to compile, by default all YML files in the project directory")
+
+    def handle(self, *args, **options):
+        yml_files = options['yml_files'] or sorted(glob.glob(os.path.join(settings.BASEDIR, '*.yml')))
+
+        for yml_path in yml_files:
+            try:
+                compiled_path = kg.compile_graph(yml_path)
+            except Exception as e:
+                raise CommandError(f"Could not compile {yml_path}: {e}")
+
+            self.stdout.write(f"{yml_path} -> {compiled_path}")
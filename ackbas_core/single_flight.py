@@ -0,0 +1,125 @@
+"""
+Coalescing of identical solution queries, so concurrent duplicates wait for the first search instead of starting their own
+"""
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+@dataclass
+class RTFlight:
+    future: concurrent.futures.Future
+    waiters: int = 0  # callers waiting for the result of the first one
+
+
+class RTSingleFlight:
+    """
+    Runs at most one computation per key at a time, callers with the same key share the result or exception of the
+    running computation. Results are not kept after the computation is done, see solution_cache for that.
+    The results are concurrent futures, so callers in different threads and event loops can wait for the same one.
+    """
+    def __init__(self, max_keys: int = 256):
+        self.max_keys = max_keys  # number of recent keys the waiter counts are kept for
+        self.leaders = 0
+        self.coalesced = 0
+        self._flights: Dict[Hashable, RTFlight] = {}
+        # key -> total number of callers that waited for another caller, ordered from least to most recently used
+        self._coalesced_by_key: OrderedDict[Hashable, int] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def run(self, key: Hashable, func: Callable, *args) -> Any:
+        """
+        Return func(*args), or the result of the call with the same key that is already running
+        """
+        future, leader = self._join(key)
+        if leader:
+            try:
+                future.set_result(func(*args))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                self._leave(key)
+
+        return future.result()
+
+    async def run_async(self, key: Hashable, func: Callable[..., Awaitable], *args) -> Any:
+        """
+        Same as run for a coroutine function. The computation runs as a separate task, so it goes on for the
+        waiting callers if the first caller is cancelled.
+        """
+        future, leader = self._join(key)
+        if leader:
+            task = asyncio.ensure_future(func(*args))
+
+            def finish(task: asyncio.Future):
+                if task.cancelled():
+                    future.set_exception(asyncio.CancelledError())
+                elif task.exception() is not None:
+                    future.set_exception(task.exception())
+                else:
+                    future.set_result(task.result())
+                self._leave(key)
+
+            task.add_done_callback(finish)
+
+        return await asyncio.wrap_future(future)
+
+    def _join(self, key: Hashable) -> Tuple[concurrent.futures.Future, bool]:
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.waiters += 1
+                self.coalesced += 1
+                self._coalesced_by_key[key] = self._coalesced_by_key.get(key, 0) + 1
+                self._coalesced_by_key.move_to_end(key)
+                while len(self._coalesced_by_key) > self.max_keys:
+                    self._coalesced_by_key.popitem(last=False)
+                return flight.future, False
+
+            flight = RTFlight(concurrent.futures.Future())
+            self._flights[key] = flight
+            self.leaders += 1
+            return flight.future, True
+
+    def _leave(self, key: Hashable):
+        with self._lock:
+            del self._flights[key]
+
+    def waiter_counts(self) -> Dict[Hashable, Dict[str, int]]:
+        """
+        Callers currently waiting and in total per key, for running computations and the most recent other keys
+        """
+        with self._lock:
+            counts = {key: {'waiting': 0, 'total': total} for key, total in self._coalesced_by_key.items()}
+            for key, flight in self._flights.items():
+                counts[key] = {'waiting': flight.waiters, 'total': self._coalesced_by_key.get(key, 0)}
+            return counts
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'in_flight': len(self._flights),
+                'leaders': self.leaders,
+                'coalesced': self.coalesced
+            }
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight() -> RTSingleFlight:
+    """
+    Return the single flight group shared by all solution views of this process
+    """
+    global _single_flight
+    with _single_flight_lock:
+        if _single_flight is None:
+            _single_flight = RTSingleFlight()
+
+        return _single_flight
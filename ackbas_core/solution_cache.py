@@ -0,0 +1,173 @@
+"""
+Caches for serialized solution graphs, keyed by knowledge graph content and the normalized query
+"""
+from __future__ import annotations
+
+import copy
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from ackbas_core.solution_sketch import RTSearchOptions
+
+# limits that lead to a partial result depending on timing, such results are never cached
+NON_DETERMINISTIC_LIMITS = ('timeout', 'cancelled')
+
+
+def query_key(start_dict: Dict, target_dict: Dict, options: Optional[RTSearchOptions]) -> str:
+    """
+    Hash of a solution query that is independent of the formatting of the start and target YML
+    """
+    if options is None:
+        options = RTSearchOptions()
+
+    budget = options.budget
+    normalized = {
+        'start': start_dict,
+        'target': target_dict,
+        'strategy': options.strategy,
+        'order': options.order,
+        'exhaustive': options.exhaustive,
+        'max_solutions': options.max_solutions,
+        # pruning does not change complete results, but the names of the objects and what a limited search reaches
+        'pruning': [options.prune_unreachable, options.bidirectional],
+        # merged branches are named without gaps and the limits apply per branch, the number of workers does not matter
+        'parallel': options.workers > 1,
+        # the timeout does not change complete results and timed out results are not cached
+        'limits': [budget.max_method_instances, budget.max_objects, budget.max_depth]
+    }
+    normalized_json = json.dumps(normalized, sort_keys=True, separators=(',', ':'), default=str)
+
+    return hashlib.sha256(normalized_json.encode('utf8')).hexdigest()
+
+
+def is_cacheable(result: Dict) -> bool:
+    return result.get('partial_reason') not in NON_DETERMINISTIC_LIMITS
+
+
+class RTLocalSolutionCache:
+    """
+    In-process LRU cache, entries of a graph are dropped as soon as the graph is seen with different contents
+    """
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        # (graph name, graph hash, query key) -> result, ordered from least to most recently used
+        self._entries: OrderedDict[Tuple[str, str, str], Dict] = OrderedDict()
+        self._graph_hashes: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def get(self, graph_name: str, graph_hash: str, key: str) -> Optional[Dict]:
+        with self._lock:
+            self._check_graph_hash(graph_name, graph_hash)
+            entry_key = (graph_name, graph_hash, key)
+            if entry_key not in self._entries:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(entry_key)
+            self.hits += 1
+            return copy.deepcopy(self._entries[entry_key])
+
+    def set(self, graph_name: str, graph_hash: str, key: str, result: Dict):
+        with self._lock:
+            self._check_graph_hash(graph_name, graph_hash)
+            entry_key = (graph_name, graph_hash, key)
+            self._entries[entry_key] = copy.deepcopy(result)
+            self._entries.move_to_end(entry_key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _check_graph_hash(self, graph_name: str, graph_hash: str):
+        if self._graph_hashes.get(graph_name, graph_hash) != graph_hash:
+            # the YML file changed, all results for the old contents are stale
+            for entry_key in [k for k in self._entries if k[0] == graph_name]:
+                del self._entries[entry_key]
+        self._graph_hashes[graph_name] = graph_hash
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._graph_hashes.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'max_size': self.max_size
+            }
+
+
+class RTDjangoSolutionCache:
+    """
+    Cache shared by all workers, based on a cache configured in the Django CACHES setting.
+    The graph hash is part of the key, so entries for outdated graph contents are never hit and expire after timeout.
+    """
+    def __init__(self, alias: str = 'default', timeout: Optional[float] = 3600, key_prefix: str = 'methodnet-solution'):
+        self.alias = alias
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+        self.hits = 0
+        self.misses = 0
+
+    def _cache_key(self, graph_hash: str, key: str) -> str:
+        return f"{self.key_prefix}:{graph_hash}:{key}"
+
+    def get(self, graph_name: str, graph_hash: str, key: str) -> Optional[Dict]:
+        result = caches[self.alias].get(self._cache_key(graph_hash, key))
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def set(self, graph_name: str, graph_hash: str, key: str, result: Dict):
+        caches[self.alias].set(self._cache_key(graph_hash, key), result, self.timeout)
+
+    def clear(self):
+        caches[self.alias].clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+_solution_cache = None
+_solution_cache_lock = threading.Lock()
+
+
+def get_solution_cache():
+    """
+    Return the cache configured in settings.SOLUTION_CACHE, None if caching is disabled
+    """
+    global _solution_cache
+    with _solution_cache_lock:
+        if _solution_cache is None:
+            config = getattr(settings, 'SOLUTION_CACHE', None)
+            if not config:
+                return None
+            cache_class = import_string(config['BACKEND'])
+            _solution_cache = cache_class(**config.get('OPTIONS', {}))
+
+        return _solution_cache
+
+
+@receiver(setting_changed)
+def reset_solution_cache(setting, **kwargs):
+    global _solution_cache
+    if setting == 'SOLUTION_CACHE':
+        with _solution_cache_lock:
+            _solution_cache = None
@@ -1,9 +1,23 @@
 from __future__ import annotations
-from dataclasses import dataclass
-from typing import Dict, Union, Optional, List
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+from typing import Dict, Union, Optional, List, FrozenSet, Set, Tuple, Iterator, Iterable, Callable, Any
 from ackbas_core.knowledge_graph import RTTypeDefinition, RTMethod, RTGraph, \
-    RTEnumValue, RTParamPlaceholder, RTMethodInput, RTParamUnset
+    RTEnumValue, RTMethodInput, RTParamType
+import atexit
+import concurrent.futures
+import io
 import itertools
+import heapq
+import multiprocessing
+import pickle
+import threading
+import time
+
+try:
+    import numpy
+except ImportError:  # optional, only used by RTParamMatrix
+    numpy = None
 
 
 RTChoiceSpace = Dict[str, str]
@@ -12,19 +26,148 @@ RTChoiceSpace = Dict[str, str]
 class RTSolutionGraph:
     """
     Solution graph contains sequence of methods and generated objects that result in an object which fits
-    the target specification.
+    the target specification. Without a target spec, the search runs until nothing new can be generated.
     """
-    def __init__(self, start_objects: List[RTObjectInstance], target_spec: RTMethodInput):
+    def __init__(self, start_objects: List[RTObjectInstance], target_spec: Optional[RTMethodInput]):
         self.target_spec = target_spec
         self.method_instances: Dict[str, RTMethodInstance] = {}
-        self.object_instances: Dict[str, RTObjectInstance] = {obj.name: obj for obj in start_objects}
+        self.end_objects: List[RTObjectInstance] = []
+        self.partial_reason: Optional[str] = None  # set if the search did not run to completion
+        self.relevant_methods: Optional[FrozenSet[str]] = None  # names of the methods the search may use, None for all
+        self.choice_space_encoder = RTChoiceSpaceEncoder()
+        self._clear_object_indexes()
+
         for obj in start_objects:
             obj.is_start = True
+            self.add_object(obj)
 
         self._auto_id = 1
 
-    def get_objects_in_choice_space(self, choice_space: RTChoiceSpace):
-        return [o for o in self.object_instances.values() if o.in_choice_space(choice_space)]
+    def _clear_object_indexes(self):
+        self.object_instances: Dict[str, RTObjectInstance] = {}
+
+        # objects grouped by the bits of their encoded choice space, overall and per type name
+        self._objects_by_choice_space: Dict[int, List[RTObjectInstance]] = {}
+        self._objects_by_type: Dict[str, Dict[int, List[RTObjectInstance]]] = {}
+        # insertion position of every object, used to return query results in graph order
+        self._object_order: Dict[str, int] = {}
+        # type name -> param mask -> param vector -> choice space bits -> objects, see is_redundant
+        self._objects_by_params: Dict[str, Dict[int, Dict[Tuple, Dict[int, List[RTObjectInstance]]]]] = {}
+
+    def mark_partial(self, reason: str):
+        """
+        Record that the search was stopped by a limit, keeping the first reason
+        """
+        if self.partial_reason is None:
+            self.partial_reason = reason
+
+    def add_end_object(self, obj: RTObjectInstance):
+        """
+        Mark an object matching the target spec and everything leading to it as part of the solution
+        """
+        obj.is_end = True
+        self.end_objects.append(obj)
+        if obj.output_of:
+            obj.output_of.color_as_on_solution_path()
+
+    def add_object(self, obj: RTObjectInstance):
+        self.object_instances[obj.name] = obj
+        self._object_order[obj.name] = len(self._object_order)
+
+        choice_space_key, _ = self.choice_space_encoder.encode(obj.choice_space)
+        self._objects_by_choice_space.setdefault(choice_space_key, []).append(obj)
+        self._objects_by_type.setdefault(obj.type.name, {}).setdefault(choice_space_key, []).append(obj)
+        self._objects_by_params.setdefault(obj.type.name, {}).setdefault(obj.param_mask, {}) \
+            .setdefault(obj.param_vector, {}).setdefault(choice_space_key, []).append(obj)
+
+    def is_redundant(self, new_obj: RTObjectInstance, choice_space: RTChoiceSpace) -> bool:
+        """
+        Check whether an object in the given choice space already provides everything the new object would,
+        see new_object_is_redundant
+        """
+        new_mask, new_vector = new_obj.param_mask, new_obj.param_vector
+        new_params = new_obj.param_values.items()
+        choice_space_bits, _ = self.choice_space_encoder.encode(choice_space)
+        new_choice_space_bits, _ = self.choice_space_encoder.encode(new_obj.choice_space)
+        # choices that are made in both the given and the new object's choice space
+        common_bits = choice_space_bits & new_choice_space_bits
+
+        # old objects knowing at least the params of the new one with the same values: those with the same params
+        # are looked up by value, the others are compared at the positions of the new object's params
+        new_positions = None
+        for mask, objects_by_vector in self._objects_by_params.get(new_obj.type.name, {}).items():
+            if mask == new_mask:
+                objects_by_choice_space = objects_by_vector.get(new_vector)
+                if objects_by_choice_space is not None and \
+                        RTSolutionGraph.covering_object_exists(objects_by_choice_space, common_bits, new_params):
+                    return True
+            elif mask & new_mask == new_mask:
+                if new_positions is None:
+                    new_positions = [i for i in range(len(new_vector)) if new_mask >> i & 1]
+                for vector, objects_by_choice_space in objects_by_vector.items():
+                    if all(vector[i] == new_vector[i] for i in new_positions) and \
+                            RTSolutionGraph.covering_object_exists(objects_by_choice_space, common_bits, new_params):
+                        return True
+
+        return False
+
+    @staticmethod
+    def covering_object_exists(objects_by_choice_space: Dict[int, List[RTObjectInstance]], common_bits: int,
+                               params: Iterable[Tuple[str, Any]]) -> bool:
+        # the choices of the object have to be made in both choice spaces, and it has to have all of the params.
+        # The param codes only stand for the params of the type, so the values themselves are compared.
+        for old_choice_space_bits, old_objects in objects_by_choice_space.items():
+            if old_choice_space_bits & common_bits == old_choice_space_bits:
+                for old_obj in old_objects:
+                    old_params = old_obj.param_values
+                    if all(name in old_params and old_params[name] == value for name, value in params):
+                        return True
+        return False
+
+    def get_objects_in_choice_space(self, choice_space: RTChoiceSpace, type_def: Optional[RTTypeDefinition] = None):
+        """
+        Return all objects (optionally only of the given type) that are valid inside the given choice space
+        """
+        if type_def is None:
+            index = self._objects_by_choice_space
+        else:
+            index = self._objects_by_type.get(type_def.name, {})
+
+        query_bits = self.choice_space_encoder.encode(choice_space)[0]
+        result = []
+        for choice_space_bits, objects in index.items():
+            # an object is valid if its choices are a subset of the queried choices
+            if choice_space_bits & query_bits == choice_space_bits:
+                result.extend(objects)
+
+        result.sort(key=lambda o: self._object_order[o.name])
+        return result
+
+    def retarget(self, target_spec: RTMethodInput):
+        """
+        Replace the target spec after the search, marking the objects matching the new one and the paths leading to
+        them as the solution. After an exhaustive search, this is the solution an exhaustive search for the new target
+        finds, plus matching objects such a search does not visit because they are redundant within their branch.
+        """
+        self.target_spec = target_spec
+        self.end_objects = []
+        for method in self.method_instances.values():
+            method.on_solution_path = False
+        for obj in self.object_instances.values():
+            obj.is_end = False
+            obj.on_solution_path = False
+
+        for obj in self.object_instances.values():
+            if object_matches_input_spec(obj, target_spec):
+                self.add_end_object(obj)
+
+    def solution_path(self) -> Tuple[List[RTObjectInstance], List[RTMethodInstance]]:
+        """
+        Objects and methods prune would keep, without removing the others
+        """
+        objects = [obj for obj in self.object_instances.values() if not obj.output_of or obj.output_of.on_solution_path]
+        methods = [method for method in self.method_instances.values() if method.on_solution_path]
+        return objects, methods
 
     def prune(self):
         # remove all methods and objects not on the solution path
@@ -36,22 +179,148 @@ class RTSolutionGraph:
             if not method.on_solution_path:
                 del self.method_instances[method_name]
 
+        # rebuild the indexes from the remaining objects
+        remaining_objects = list(self.object_instances.values())
+        self._clear_object_indexes()
+        for obj in remaining_objects:
+            self.add_object(obj)
+
     def next_id(self):
         self._auto_id += 1
         return self._auto_id - 1
 
 
-@dataclass
+class RTFrozenDict(dict):
+    """
+    Read-only dict for choice spaces and param values, which may be shared between objects
+    """
+    __slots__ = ()
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Choice spaces and param values are read-only, build a new dict and freeze it")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _read_only
+
+    def copy(self) -> Dict:
+        return dict(self)
+
+    def __reduce__(self):
+        # the default way of pickling dict subclasses sets the items one by one
+        return type(self), (dict(self),)
+
+
+def freeze(d: Dict) -> RTFrozenDict:
+    """
+    Return a read-only version of d, frozen dicts are returned as they are so they can be shared
+    """
+    if type(d) is RTFrozenDict:
+        return d
+
+    return RTFrozenDict(d)
+
+
+class RTFrozenChoiceSpace(RTFrozenDict):
+    """
+    Read-only choice space, remembering its encoding by the last RTChoiceSpaceEncoder used on it
+    """
+    __slots__ = ('encoder', 'bits', 'mask')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.encoder = None
+
+
+def freeze_choice_space(choice_space: RTChoiceSpace) -> RTFrozenChoiceSpace:
+    if type(choice_space) is RTFrozenChoiceSpace:
+        return choice_space
+
+    return RTFrozenChoiceSpace(choice_space)
+
+
+class RTChoiceSpaceEncoder:
+    """
+    Encodes choice spaces as a pair of ints: bits has one bit set per chosen (method instance, option), mask has the
+    bits of all options known for the method instances with a choice.
+    Choice space a lies within b if a.bits & b.bits == a.bits, they are compatible if (a.bits ^ b.bits) & a.mask & b.mask == 0.
+    Bits are assigned on first use, so only choice spaces encoded by the same encoder can be compared.
+    Avoid ~ on the bits, the complement of a positive int is negative and & with it walks all bits of both operands.
+    """
+    def __init__(self):
+        self._option_bits: Dict[Tuple[str, str], int] = {}
+        self._method_masks: Dict[str, int] = {}
+
+    def encode(self, choice_space: RTChoiceSpace) -> Tuple[int, int]:
+        """
+        Return bits and mask of a choice space, frozen choice spaces are only encoded once
+        """
+        is_frozen = type(choice_space) is RTFrozenChoiceSpace
+        if is_frozen and choice_space.encoder is self:
+            return choice_space.bits, choice_space.mask
+
+        bits = 0
+        for method_option in choice_space.items():
+            option_bit = self._option_bits.get(method_option)
+            if option_bit is None:
+                option_bit = 1 << len(self._option_bits)
+                self._option_bits[method_option] = option_bit
+                method_name = method_option[0]
+                self._method_masks[method_name] = self._method_masks.get(method_name, 0) | option_bit
+            bits |= option_bit
+
+        # a mask includes all options registered up to now, including the other option of an earlier encoded
+        # choice space, so a conflict shows up in the mask of at least the later encoded choice space
+        mask = 0
+        for method_name in choice_space:
+            mask |= self._method_masks[method_name]
+
+        if is_frozen:
+            choice_space.encoder = self
+            choice_space.bits = bits
+            choice_space.mask = mask
+
+        return bits, mask
+
+    def contains(self, outer: RTChoiceSpace, inner: RTChoiceSpace) -> bool:
+        """
+        Whether all choices of inner are also made in outer, i.e. objects in inner are valid in outer
+        """
+        inner_bits = self.encode(inner)[0]
+        return inner_bits & self.encode(outer)[0] == inner_bits
+
+
 class RTObjectInstance:
-    name: str
-    type: RTTypeDefinition
-    choice_space: RTChoiceSpace  # method instance name -> output option
-    param_values: Dict[str, Union[int, RTEnumValue]]
-    output_of: Optional[RTMethodInstance]
-    is_start = False
-    is_end = False
-    distance_to_start = 0
-    on_solution_path = False
+    __slots__ = ('name', 'type', 'choice_space', 'param_values', 'param_mask', 'param_vector', 'output_of',
+                 'is_start', 'is_end', 'distance_to_start', 'on_solution_path', 'version')
+
+    def __init__(self, name: str, type: RTTypeDefinition, choice_space: RTChoiceSpace,
+                 param_values: Dict[str, Union[int, RTEnumValue]], output_of: Optional[RTMethodInstance]):
+        self.name = name
+        self.type = type
+        self.choice_space: RTChoiceSpace = freeze_choice_space(choice_space)  # method instance name -> output option
+        self.set_param_values(param_values)
+        self.output_of = output_of
+        self.is_start = False
+        self.is_end = False
+        self.distance_to_start = 0
+        self.on_solution_path = False
+        self.version = 0  # incremented whenever the producing method recalculates the object
+
+    def __repr__(self):
+        return f"RTObjectInstance(name={self.name!r}, type={self.type.name!r}, choice_space={dict(self.choice_space)!r}, " \
+               f"param_values={dict(self.param_values)!r})"
+
+    def set_param_values(self, param_values: Dict[str, Union[int, RTEnumValue]]):
+        """
+        Replace the param values, keeping their encoding for matching input specs up to date
+        """
+        self.param_values: Dict[str, Union[int, RTEnumValue]] = freeze(param_values)
+        self.param_mask, self.param_vector = self.type.encode_params(self.param_values)
+
+    def signature(self) -> Tuple[str, FrozenSet, FrozenSet[Tuple[str, str]]]:
+        """
+        Hashable description of the object's content: type name, param values and choice space
+        """
+        return self.type.name, frozenset(self.param_values.items()), frozenset(self.choice_space.items())
 
     def in_choice_space(self, other_choice_space: RTChoiceSpace):
         for method_name, option in self.choice_space.items():
@@ -61,23 +330,103 @@ class RTObjectInstance:
         return True
 
 
-@dataclass
 class RTMethodInstance:
-    method: RTMethod
-    name: str
-    inputs: Dict[str, Optional[RTObjectInstance]]
-    outputs: Dict[str, Dict[str, Optional[RTObjectInstance]]]
-    on_solution_path = False
+    __slots__ = ('method', 'name', 'inputs', 'outputs', 'on_solution_path', '_input_versions', '_checked_invalidations')
+    # number of invalidate calls in this process, see _checked_invalidations
+    _invalidations = 0
+
+    def __init__(self, method: RTMethod, name: str, inputs: Dict[str, Optional[RTObjectInstance]],
+                 outputs: Dict[str, Dict[str, Optional[RTObjectInstance]]]):
+        self.method = method
+        self.name = name
+        self.inputs = inputs
+        self.outputs = outputs
+        self.on_solution_path = False
+        # (name, version) of the input objects at the last propagation, None if the outputs were never calculated
+        self._input_versions: Optional[Tuple[Tuple[str, int], ...]] = None
+        # _invalidations when this method and everything upstream were last known to be up to date, an invalidation
+        # since then may have made any method upstream outdated
+        self._checked_invalidations = RTMethodInstance._invalidations
+
+    def __repr__(self):
+        return f"RTMethodInstance(method={self.method.name!r}, name={self.name!r})"
 
     def propagate(self):
         # TODO: maybe this should automatically be done when instantiating the method? or at least automatically create
         #       the output objects
 
-        # propagate parameters to objects connected to inputs
-        for input_obj in self.inputs.values():
-            if input_obj is not None and input_obj.output_of is not None:
-                input_obj.output_of.propagate()
+        # propagate parameters to objects connected to inputs, upstream methods first
+        # up to date methods end the walk upstream, so a method added to a propagated chain only calculates itself.
+        # Methods walked only because of an invalidation are calculated again if their inputs changed by now.
+        for predecessor_method in self.predecessor_methods(outdated_only=True):
+            if predecessor_method.is_outdated():
+                predecessor_method.propagate_outputs()
+            predecessor_method._checked_invalidations = RTMethodInstance._invalidations
+
+        self.propagate_outputs()
+        self._checked_invalidations = RTMethodInstance._invalidations
+
+    def output_objects(self) -> Iterator[RTObjectInstance]:
+        for output_option in self.outputs.values():
+            for output_obj in output_option.values():
+                yield output_obj
+
+    def is_outdated(self) -> bool:
+        """
+        Whether the outputs need to be calculated again, because they never were or an input object changed since
+        """
+        return self._input_versions != self._current_input_versions()
+
+    def mark_propagated(self):
+        """
+        Record the current input objects as calculated, e.g. after they were renamed
+        """
+        self._input_versions = self._current_input_versions()
+
+    def invalidate(self):
+        """
+        Force recalculation of the outputs on the next propagation, e.g. after changing the method.
+        Propagating any method downstream calculates this one and the methods in between again.
+        """
+        self._input_versions = None
+        RTMethodInstance._invalidations += 1
 
+    def _current_input_versions(self) -> Tuple[Tuple[str, int], ...]:
+        return tuple((obj.name, obj.version) for obj in self.inputs.values() if obj is not None)
+
+    def predecessor_methods(self, outdated_only: bool = False) -> List[RTMethodInstance]:
+        """
+        All methods upstream of this one, ordered so every method comes after the methods it depends on.
+        With outdated_only, up to date methods and everything upstream of them are left out, unless there was an
+        invalidation since they were last propagated, which may have made a method upstream outdated.
+        """
+        ordered = []
+        visited = {self.name}
+        # iterative post-order traversal, the flag marks whether the method's inputs were already expanded
+        stack = [(self, False)]
+        while stack:
+            method_instance, expanded = stack.pop()
+            if expanded:
+                if method_instance is not self:
+                    ordered.append(method_instance)
+                continue
+
+            stack.append((method_instance, True))
+            for input_obj in reversed(list(method_instance.inputs.values())):
+                if input_obj is None or input_obj.output_of is None or input_obj.output_of.name in visited:
+                    continue
+                if outdated_only and not input_obj.output_of.is_outdated() and \
+                        input_obj.output_of._checked_invalidations == RTMethodInstance._invalidations:
+                    continue
+                visited.add(input_obj.output_of.name)
+                stack.append((input_obj.output_of, False))
+
+        return ordered
+
+    def propagate_outputs(self):
+        """
+        Calculate choice space, distance and parameters of the output objects from the current input objects
+        """
         # calculate the common choice space
         # all common keys in the inputs need to match, then just collect all choices over all inputs
         common_choice_space: RTChoiceSpace = {}
@@ -85,21 +434,19 @@ class RTMethodInstance:
             if input_obj is None:
                 continue
 
-            for method_name, option in input_obj.choice_space.items():
-                if method_name in common_choice_space:
-                    assert common_choice_space[method_name] == option, "Input choice spaces incompatible"
-                else:
-                    common_choice_space[method_name] = option
+            common_choice_space = merge_choice_spaces(common_choice_space, input_obj.choice_space)
+            assert common_choice_space is not None, "Input choice spaces incompatible"
 
         # calculate distance from start
         output_distance_to_start = max(i.distance_to_start for i in self.inputs.values() if i is not None) + 1
 
         for option_name, output_option in self.outputs.items():
             # the choice space for all output objects on this branch
-            new_choice_space = common_choice_space.copy()
             if len(self.outputs) > 1:
                 # only narrow choice space if there was actually a choice
-                new_choice_space[self.name] = option_name
+                new_choice_space = freeze_choice_space({**common_choice_space, self.name: option_name})
+            else:
+                new_choice_space = freeze_choice_space(common_choice_space)
 
             for output_name, output_obj in output_option.items():
                 if output_obj is None:
@@ -110,51 +457,614 @@ class RTMethodInstance:
                 output_obj.choice_space = new_choice_space
                 output_obj.distance_to_start = output_distance_to_start
 
+                # collect the new parameters in a mutable copy, which is frozen again at the end
+                param_values = output_obj.param_values.copy()
+
                 # copy parameters from matching input object if it exists
                 for input_name, input_obj in self.inputs.items():
                     if input_name == output_name:
                         for param_name, param_val in input_obj.param_values.items():
-                            output_obj.param_values[param_name] = param_val
+                            param_values[param_name] = param_val
                         break
 
                 # set output object parameters based on literals or input object parameters
-                for param_name, param_statement in output_def.param_statements.items():
-                    if isinstance(param_statement, int) or isinstance(param_statement, RTEnumValue):
+                for binding in output_def.param_bindings:
+                    if binding.literal is not None:
                         # output param is literal value, just set it
-                        output_obj.param_values[param_name] = param_statement
-                    elif isinstance(param_statement, RTParamPlaceholder):
-                        # search inputs for matching placeholder
-                        for input_name, input_def in self.method.inputs.items():
-                            for in_param_name, param_constraint in input_def.param_constraints.items():
-                                if isinstance(param_constraint, RTParamPlaceholder) and param_constraint.name == param_statement.name:
-                                    # we found the matching placeholder
-                                    # now find the input object
-                                    if input_name not in self.inputs:
-                                        continue
-                                    input_obj = self.inputs[input_name]
-                                    assert input_obj is not None, "Cannot infer parameter " + param_name + " for " + output_obj.name + " because input " + input_name + " is not connected"
-                                    # copy value from input object if param is set there
-                                    if in_param_name in input_obj.param_values:
-                                        output_obj.param_values[param_name] = input_obj.param_values[in_param_name]
-                                        # now we need to break out of these loops
-                                        break
-                            else:
-                                continue
+                        param_values[binding.param_name] = binding.literal
+                        continue
+
+                    # copy value from the first connected input object where the bound param is set
+                    for input_name, in_param_name in binding.sources:
+                        if input_name not in self.inputs:
+                            continue
+                        input_obj = self.inputs[input_name]
+                        assert input_obj is not None, "Cannot infer parameter " + binding.param_name + " for " + output_obj.name + " because input " + input_name + " is not connected"
+                        if in_param_name in input_obj.param_values:
+                            param_values[binding.param_name] = input_obj.param_values[in_param_name]
                             break
 
+                output_obj.set_param_values(param_values)
+                output_obj.version += 1
+
+        self.mark_propagated()
+
     def color_as_on_solution_path(self):
         self.on_solution_path = True
+        stack = [self]
+
+        while stack:
+            method_instance = stack.pop()
+            for input_obj in method_instance.inputs.values():
+                if input_obj is not None:
+                    input_obj.on_solution_path = True
+                    predecessor_method = input_obj.output_of
+                    if predecessor_method is not None and not predecessor_method.on_solution_path:
+                        predecessor_method.on_solution_path = True
+                        stack.append(predecessor_method)
+
+
+@dataclass
+class RTSearchTask:
+    """
+    A choice space still to be flooded, together with the objects to start from
+    """
+    choice_space: RTChoiceSpace
+    start_objects: List[RTObjectInstance]
+    depth: int = 0  # number of branchings since the initial choice space
+    index: int = 0  # position among the tasks created by the same branching
+
+
+class RTSearchQueue:
+    """
+    Work list of search tasks ordered by priority, ties are resolved in insertion order.
+
+    Supported orders:
+      'depth': depth-first, processes a branch completely before its siblings (default)
+      'breadth': all branches of one depth before going deeper
+      'distance': best-first, branches whose start objects are closest to the start objects first
+    """
+    orders = ('depth', 'breadth', 'distance')
+
+    def __init__(self, order: str = 'depth'):
+        assert order in self.orders, f"Unknown search order {order}"
+        self.order = order
+        self._heap = []
+        self._counter = itertools.count()
+
+    def priority(self, task: RTSearchTask):
+        if self.order == 'depth':
+            return -task.depth, task.index
+        elif self.order == 'breadth':
+            return task.depth, task.index
+        else:
+            return min((obj.distance_to_start for obj in task.start_objects), default=0), task.depth
+
+    def push(self, task: RTSearchTask):
+        heapq.heappush(self._heap, (self.priority(task), next(self._counter), task))
+
+    def pop(self) -> RTSearchTask:
+        return heapq.heappop(self._heap)[-1]
+
+    def __len__(self):
+        return len(self._heap)
+
+
+@dataclass
+class RTSearchBudget:
+    """
+    Limits for a single search, None means unlimited. The search stops once a limit is reached.
+    """
+    max_method_instances: Optional[int] = None
+    max_objects: Optional[int] = None
+    max_depth: Optional[int] = None  # number of nested branchings, deeper choice spaces are skipped
+    timeout: Optional[float] = None  # seconds
+    # set from another thread to cancel the search, anything with is_set() will do (see RTCancelFlag)
+    cancel_event: Optional[threading.Event] = None
+    deadline: Optional[float] = None  # time.monotonic() value, set by start()
+
+    def start(self):
+        if self.timeout is not None:
+            self.deadline = time.monotonic() + self.timeout
+
+    def exceeded(self, solution_graph: RTSolutionGraph) -> Optional[str]:
+        """
+        Name of the first exhausted limit, None if the search may continue
+        """
+        if self.max_method_instances is not None and len(solution_graph.method_instances) >= self.max_method_instances:
+            return 'max_method_instances'
+        if self.max_objects is not None and len(solution_graph.object_instances) >= self.max_objects:
+            return 'max_objects'
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return 'timeout'
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            return 'cancelled'
+        return None
+
+
+@dataclass
+class RTSearchOptions:
+    """
+    Settings for flood_fill and best_first_fill, the defaults stop each branch at its first object matching the target
+    """
+    strategy: str = 'flood'  # see SEARCH_STRATEGIES
+    order: str = 'depth'  # see RTSearchQueue
+    exhaustive: bool = False  # keep searching branches after reaching the target to find all matching objects
+    max_solutions: Optional[int] = None  # stop the whole search after this many matching objects
+    budget: RTSearchBudget = field(default_factory=RTSearchBudget)
+    prune_unreachable: bool = True  # skip methods that cannot lead to the target, see RTGraph.relevant_methods
+    bidirectional: bool = False  # narrow these methods by searching backwards from the target spec
+    workers: int = 1  # processes flood_fill searches branches with, see search_tasks_in_parallel
+    # called with the solution graph after every wave of new objects, e.g. to send them to the client right away
+    progress: Optional[Callable[[RTSolutionGraph], None]] = field(default=None, compare=False)
+
+    def enough_solutions(self, solution_graph: RTSolutionGraph) -> bool:
+        return self.max_solutions is not None and len(solution_graph.end_objects) >= self.max_solutions
+
+
+def flood_fill(solution_graph: RTSolutionGraph, knowledge_graph: RTGraph, choice_space: RTChoiceSpace,
+               start_objects: List[RTObjectInstance], options: Optional[RTSearchOptions] = None):
+    """
+    Search the solution graph starting with the given objects, processing branched choice spaces from a work list
+    """
+    if options is None:
+        options = RTSearchOptions()
+
+    tasks = [RTSearchTask(choice_space, start_objects)]
+    if options.workers > 1:
+        search_tasks_in_parallel(solution_graph, knowledge_graph, tasks, options)
+    else:
+        run_search_tasks(solution_graph, knowledge_graph, tasks, options, flood_choice_space)
+
+
+def search_targets(knowledge_graph: RTGraph, start_objects: List[RTObjectInstance], target_specs: List[RTMethodInput],
+                   options: Optional[RTSearchOptions] = None) -> RTSolutionGraph:
+    """
+    One exhaustive flood_fill without a target, shared by several target specs. Unless options.prune_unreachable is
+    off, only methods that can lead to one of the targets are used.
+    Mark the solution for each target with RTSolutionGraph.retarget.
+    """
+    if options is None:
+        options = RTSearchOptions()
+    # a target reached earlier must not stop the search for the others
+    options = replace(options, strategy='flood', exhaustive=True, max_solutions=None)
+
+    solution_graph = RTSolutionGraph(start_objects, None)
+    if options.prune_unreachable:
+        solution_graph.relevant_methods = frozenset().union(
+            *(knowledge_graph.relevant_methods(target_spec, options.bidirectional) for target_spec in target_specs))
+    flood_fill(solution_graph, knowledge_graph, {}, start_objects, options)
+
+    return solution_graph
+
+
+@dataclass
+class RTWitness:
+    """
+    Shortest known derivation of an object from the start objects
+    """
+    obj: RTObjectInstance
+    methods: List[RTMethodInstance]  # in an order they can be applied in, the last one generates obj
+
+
+RTObjectSignature = Tuple[str, FrozenSet, FrozenSet[Tuple[str, str]]]  # see RTObjectInstance.signature
+
+
+class RTClosureIndex:
+    """
+    Everything that can be generated from the start objects of a solution graph searched without a target, indexed by
+    the signature of the objects, with the derivation needing the fewest method instances for each signature
+    """
+    def __init__(self, solution_graph: RTSolutionGraph):
+        self.solution_graph = solution_graph
+        self.witnesses: Dict[RTObjectSignature, RTWitness] = {}
+        self._signatures_by_type: Dict[str, List[RTObjectSignature]] = {}
+
+        # methods have to be added after the methods generating their inputs, so the graph order is a valid order
+        method_order = {name: i for i, name in enumerate(solution_graph.method_instances)}
+        derivations: Dict[str, FrozenSet[str]] = {}  # method instance name -> names of all methods it depends on
+        for method_instance in solution_graph.method_instances.values():
+            derivation = {method_instance.name}
+            for input_obj in method_instance.inputs.values():
+                if input_obj is not None and input_obj.output_of is not None:
+                    derivation.update(derivations[input_obj.output_of.name])
+            derivations[method_instance.name] = frozenset(derivation)
+
+        for obj in solution_graph.object_instances.values():
+            derivation = derivations[obj.output_of.name] if obj.output_of is not None else frozenset()
+            signature = obj.signature()
+            witness = self.witnesses.get(signature)
+            if witness is not None and len(witness.methods) <= len(derivation):
+                continue
+
+            methods = [solution_graph.method_instances[name] for name in sorted(derivation, key=method_order.get)]
+            if witness is None:
+                self._signatures_by_type.setdefault(obj.type.name, []).append(signature)
+            self.witnesses[signature] = RTWitness(obj, methods)
+
+    def lookup(self, target_spec: RTMethodInput) -> List[RTWitness]:
+        """
+        Witnesses of all reachable signatures matching the target spec, in the order they were found
+        """
+        return [self.witnesses[signature] for signature in self._signatures_by_type.get(target_spec.type.name, [])
+                if object_matches_input_spec(self.witnesses[signature].obj, target_spec)]
+
+
+def search_closure(knowledge_graph: RTGraph, start_objects: List[RTObjectInstance],
+                   options: Optional[RTSearchOptions] = None) -> RTClosureIndex:
+    """
+    Search from the start objects until nothing new can be generated, with all methods of the knowledge graph.
+    The budget of the options still applies, check partial_reason of the index's solution graph.
+    """
+    if options is None:
+        options = RTSearchOptions()
+    options = replace(options, strategy='flood', exhaustive=True, max_solutions=None, prune_unreachable=False)
+
+    solution_graph = RTSolutionGraph(start_objects, None)
+    flood_fill(solution_graph, knowledge_graph, {}, start_objects, options)
+
+    return RTClosureIndex(solution_graph)
+
+
+def best_first_fill(solution_graph: RTSolutionGraph, knowledge_graph: RTGraph, choice_space: RTChoiceSpace,
+                    start_objects: List[RTObjectInstance], options: Optional[RTSearchOptions] = None):
+    """
+    Like flood_fill, but within each choice space objects are used in the order of the cost of their derivation plus
+    the cost still needed to reach the target type (A*). Each branch therefore ends with its cheapest matching object.
+    """
+    if options is None:
+        options = RTSearchOptions()
+
+    # method instances needed to derive an object (its method and the derivations of all its inputs, starts need none)
+    # and their costs, the cost of an object is the sum over its derivation, so shared ancestors are counted once
+    derivations: Dict[str, FrozenSet[str]] = {obj.name: frozenset() for obj in start_objects}
+    method_costs: Dict[str, float] = {}
+    expanded = set()
+
+    def process_task(solution_graph, knowledge_graph, task, options):
+        return best_first_choice_space(solution_graph, knowledge_graph, task, options, derivations, method_costs,
+                                       expanded)
+
+    run_search_tasks(solution_graph, knowledge_graph, [RTSearchTask(choice_space, start_objects)], options,
+                     process_task)
+
+
+def run_search_tasks(solution_graph: RTSolutionGraph, knowledge_graph: RTGraph, tasks: List[RTSearchTask],
+                     options: RTSearchOptions,
+                     process_task: Callable[[RTSolutionGraph, RTGraph, RTSearchTask, RTSearchOptions],
+                                            List[RTSearchTask]],
+                     split_at_branching: bool = False) -> List[RTSearchTask]:
+    """
+    Process the tasks and all tasks they lead to.
+    With split_at_branching, the queued tasks are returned as soon as there is more than one, otherwise an empty list.
+    """
+    if options.prune_unreachable and solution_graph.target_spec is not None:
+        solution_graph.relevant_methods = knowledge_graph.relevant_methods(solution_graph.target_spec,
+                                                                           options.bidirectional)
+
+    queue = RTSearchQueue(options.order)
+    for task in tasks:
+        queue.push(task)
+    options.budget.start()
+
+    while queue and not options.enough_solutions(solution_graph):
+        if split_at_branching and len(queue) > 1:
+            return [queue.pop() for _ in range(len(queue))]
+
+        exceeded_limit = options.budget.exceeded(solution_graph)
+        if exceeded_limit is not None:
+            solution_graph.mark_partial(exceeded_limit)
+            break
+
+        task = queue.pop()
+        if options.budget.max_depth is not None and task.depth > options.budget.max_depth:
+            solution_graph.mark_partial('max_depth')
+            continue
+
+        for subsequent_task in process_task(solution_graph, knowledge_graph, task, options):
+            queue.push(subsequent_task)
+
+        if options.progress is not None:
+            options.progress(solution_graph)
+
+    return []
+
+
+# --- parallel search of branches ---
+# branches only see objects whose choice space lies within theirs, and the choices made in one branch are never made
+# in another one, so the tasks queued at a branching can be searched independently and merged afterwards
+
+def search_tasks_in_parallel(solution_graph: RTSolutionGraph, knowledge_graph: RTGraph, tasks: List[RTSearchTask],
+                             options: RTSearchOptions):
+    """
+    Search like run_search_tasks with flood_choice_space, but once the search branches, search every branch together
+    with the branches it leads to in a process of the branch pool.
+    The results are merged in the order of the tasks and the new objects and methods are named in that order, so the
+    result does not depend on the number of workers or which branch finishes first. The names differ from those of a
+    serial flood_fill though, which visits the branches interleaved.
+    The method and object limits still available at the branching are split evenly between the branches, the timeout
+    applies to all of them together. A branch cannot use what another one leaves of its share, so a search stopped by
+    a limit can end with fewer solutions kept than a serial search with the same budget.
+    cancel_event is checked whenever a branch finishes, branches still running when the search stops early are
+    stopped as well.
+    """
+    branch_tasks = run_search_tasks(solution_graph, knowledge_graph, tasks, options, flood_choice_space,
+                                    split_at_branching=True)
+    if not branch_tasks:
+        return
+
+    # everything the branches need is sent once and shared by all of them
+    graph_data = pickle.dumps(knowledge_graph)
+    snapshot = dumps_with_graph((solution_graph, branch_tasks), knowledge_graph)
+    budget = options.budget
+    n_branches = len(branch_tasks)
+
+    def branch_limit(limit: Optional[int], used: int) -> Optional[int]:
+        # the branch counts what is already in its snapshot too
+        return None if limit is None else used + max(limit - used, 0) // n_branches
+
+    # the branches report no progress, merged branches are reported instead
+    branch_options = replace(options, workers=1, progress=None, budget=replace(
+        budget, timeout=None, cancel_event=None, deadline=None,
+        max_method_instances=branch_limit(budget.max_method_instances, len(solution_graph.method_instances)),
+        max_objects=branch_limit(budget.max_objects, len(solution_graph.object_instances))))
+    # monotonic clocks may differ between processes, so the branches get the deadline in wall clock time
+    deadline = None if budget.deadline is None else time.time() + budget.deadline - time.monotonic()
+
+    pool, cancel_slots = get_branch_pool(options.workers)
+    slot = cancel_slots.acquire()
+    futures = [pool.submit(search_branch, graph_data, knowledge_graph.content_hash, snapshot, branch_options, i,
+                           deadline, slot)
+               for i in range(n_branches)]
+    try:
+        for future in futures:
+            while not future.done():
+                exceeded_limit = budget.exceeded(solution_graph)
+                if exceeded_limit is not None:
+                    solution_graph.mark_partial(exceeded_limit)
+                    return
+                timeout = None if budget.deadline is None else max(budget.deadline - time.monotonic(), 0)
+                concurrent.futures.wait([f for f in futures if not f.done()], timeout,
+                                        return_when=concurrent.futures.FIRST_COMPLETED)
+
+            merge_branch(solution_graph, knowledge_graph, future.result(), options)
+            if options.progress is not None:
+                options.progress(solution_graph)
+            if options.enough_solutions(solution_graph):
+                return
+    finally:
+        for future in futures:
+            future.cancel()
+        # stops the branches that are still running
+        cancel_slots.release(slot)
+
+
+def search_branch(graph_data: bytes, graph_hash: str, snapshot: bytes, options: RTSearchOptions,
+                  task_index: int, deadline: Optional[float], slot: Optional[Tuple[int, int]]) -> bytes:
+    """
+    Run in a process of the branch pool: search one branch of the snapshot and return what was added to it.
+    The search stops at the deadline (time.time() value) and once the search holding the slot released it.
+    """
+    options = replace(options, budget=replace(
+        options.budget,
+        timeout=None if deadline is None else max(deadline - time.time(), 0),
+        cancel_event=None if slot is None else RTCancelFlag(*slot)))
+
+    knowledge_graph = _branch_pool_graphs.get(graph_hash)
+    if knowledge_graph is None:
+        knowledge_graph = pickle.loads(graph_data)
+        _branch_pool_graphs[graph_hash] = knowledge_graph
+        while len(_branch_pool_graphs) > 4:
+            _branch_pool_graphs.popitem(last=False)
+    _branch_pool_graphs.move_to_end(graph_hash)
+
+    solution_graph, branch_tasks = loads_with_graph(snapshot, knowledge_graph)
+    known_objects = dict(solution_graph.object_instances)
+    n_methods = len(solution_graph.method_instances)
+    n_end_objects = len(solution_graph.end_objects)
+
+    run_search_tasks(solution_graph, knowledge_graph, [branch_tasks[task_index]], options, flood_choice_space)
+
+    new_methods = list(solution_graph.method_instances.values())[n_methods:]
+    end_object_names = [obj.name for obj in solution_graph.end_objects[n_end_objects:]]
+    return dumps_with_graph((new_methods, end_object_names, solution_graph.partial_reason), knowledge_graph,
+                            known_objects)
+
+
+def merge_branch(solution_graph: RTSolutionGraph, knowledge_graph: RTGraph, branch_result: bytes,
+                 options: RTSearchOptions):
+    """
+    Add the methods and objects found in a branch to the solution graph, with new names from its id counter
+    """
+    new_methods, end_object_names, partial_reason = loads_with_graph(branch_result, knowledge_graph,
+                                                                     solution_graph.object_instances)
+
+    # same order of ids as in apply_method: output objects first, then the method
+    new_names = {}
+    for method_instance in new_methods:
+        for output_obj in method_instance.output_objects():
+            new_names[output_obj.name] = "o" + str(solution_graph.next_id())
+        new_names[method_instance.name] = "m" + str(solution_graph.next_id())
+
+    renamed_choice_spaces = {}
+    for method_instance in new_methods:
+        method_instance.name = new_names[method_instance.name]
+        # the solution path is colored again below, the branch only knew its own end objects
+        method_instance.on_solution_path = False
+        solution_graph.method_instances[method_instance.name] = method_instance
+        for output_obj in method_instance.output_objects():
+            output_obj.name = new_names[output_obj.name]
+            output_obj.is_end = False
+            output_obj.on_solution_path = False
+            # choice spaces are shared between objects, so each is renamed once
+            choice_space_id = id(output_obj.choice_space)
+            if choice_space_id not in renamed_choice_spaces:
+                renamed_choice_spaces[choice_space_id] = freeze_choice_space(
+                    {new_names.get(method_name, method_name): option
+                     for method_name, option in output_obj.choice_space.items()})
+            output_obj.choice_space = renamed_choice_spaces[choice_space_id]
+            solution_graph.add_object(output_obj)
+
+    for method_instance in new_methods:
+        method_instance.mark_propagated()
+
+    for obj_name in end_object_names:
+        if options.enough_solutions(solution_graph):
+            break
+        solution_graph.add_end_object(solution_graph.object_instances[new_names.get(obj_name, obj_name)])
+
+    if partial_reason is not None:
+        solution_graph.mark_partial(partial_reason)
+
+
+class RTGraphPickler(pickle.Pickler):
+    """
+    Pickles parts of a solution graph, referring to the types and methods of the knowledge graph and optionally to
+    known objects by name instead of copying them
+    """
+    def __init__(self, file, knowledge_graph: RTGraph, known_objects: Optional[Dict[str, RTObjectInstance]] = None):
+        super().__init__(file)
+        # called for every pickled value, so look up the referenced kind by the exact class
+        self.references = {
+            RTTypeDefinition: ('type', knowledge_graph.types),
+            RTMethod: ('method', knowledge_graph.methods),
+            RTObjectInstance: ('object', known_objects or {})
+        }
+        for param_type in knowledge_graph.param_types.values():
+            self.references[type(param_type)] = ('param_type', knowledge_graph.param_types)
+
+    def persistent_id(self, obj) -> Optional[Tuple[str, str]]:
+        reference = self.references.get(type(obj))
+        if reference is None:
+            return None
+
+        kind, objects = reference
+        return (kind, obj.name) if objects.get(obj.name) is obj else None
+
+
+class RTGraphUnpickler(pickle.Unpickler):
+    """
+    Counterpart of RTGraphPickler, resolving the references with the given knowledge graph and objects
+    """
+    def __init__(self, file, knowledge_graph: RTGraph, known_objects: Optional[Dict[str, RTObjectInstance]] = None):
+        super().__init__(file)
+        self.references = {
+            'type': knowledge_graph.types,
+            'method': knowledge_graph.methods,
+            'param_type': knowledge_graph.param_types,
+            'object': known_objects or {}
+        }
+
+    def persistent_load(self, pid: Tuple[str, str]):
+        kind, name = pid
+        return self.references[kind][name]
+
+
+def dumps_with_graph(data: Any, knowledge_graph: RTGraph,
+                     known_objects: Optional[Dict[str, RTObjectInstance]] = None) -> bytes:
+    buffer = io.BytesIO()
+    RTGraphPickler(buffer, knowledge_graph, known_objects).dump(data)
+    return buffer.getvalue()
+
+
+def loads_with_graph(data: bytes, knowledge_graph: RTGraph,
+                     known_objects: Optional[Dict[str, RTObjectInstance]] = None) -> Any:
+    return RTGraphUnpickler(io.BytesIO(data), knowledge_graph, known_objects).load()
+
+
+class RTCancelSlots:
+    """
+    Lets the server stop searches running in a process pool, the branch pool or the solver pool. Every search writes a
+    new token into a free slot of an array shared with the pool processes, it stops as soon as the slot holds another
+    token.
+    """
+    def __init__(self, n_slots: int = 256):
+        self.tokens = multiprocessing.RawArray('q', n_slots)
+        self._free_slots = list(range(n_slots))
+        self._tokens = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def acquire(self) -> Optional[Tuple[int, int]]:
+        """
+        (slot, token) for a new search, None if all slots are taken and the search cannot be stopped
+        """
+        with self._lock:
+            if not self._free_slots:
+                return None
+            slot = self._free_slots.pop()
+            token = next(self._tokens)
+            self.tokens[slot] = token
+            return slot, token
+
+    def release(self, slot: Optional[Tuple[int, int]]):
+        if slot is None:
+            return
+        with self._lock:
+            self.tokens[slot[0]] = 0
+            self._free_slots.append(slot[0])
+
+
+class RTCancelFlag:
+    """
+    Stands in for the cancel_event of a search budget in a pool process, see RTCancelSlots
+    """
+    __slots__ = ('slot', 'token')
+
+    def __init__(self, slot: int, token: int):
+        self.slot = slot
+        self.token = token
+
+    def is_set(self) -> bool:
+        return _cancel_tokens[self.slot] != self.token
+
+
+_branch_pool = None
+_branch_pool_workers = 0
+_branch_cancel_slots: Optional[RTCancelSlots] = None
+_branch_pool_lock = threading.Lock()
+# knowledge graphs unpickled in a process of the branch pool, by content hash
+_branch_pool_graphs: OrderedDict[str, RTGraph] = OrderedDict()
+# the tokens of RTCancelSlots in a pool process
+_cancel_tokens = None
+
+
+def init_cancel_tokens(cancel_tokens):
+    global _cancel_tokens
+    _cancel_tokens = cancel_tokens
+
+
+def get_branch_pool(workers: int) -> Tuple[concurrent.futures.ProcessPoolExecutor, RTCancelSlots]:
+    """
+    Return the process pool for searching branches and the slots to stop them, they are shared by all searches and
+    replaced if the number of workers changes
+    """
+    global _branch_pool, _branch_pool_workers, _branch_cancel_slots
+    with _branch_pool_lock:
+        if _branch_pool is None or _branch_pool_workers != workers:
+            if _branch_pool is not None:
+                _branch_pool.shutdown()
+            else:
+                atexit.register(shutdown_branch_pool)
+            # shared memory can only be handed to the processes when they are started
+            _branch_cancel_slots = RTCancelSlots()
+            _branch_pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_cancel_tokens,
+                                                                  initargs=(_branch_cancel_slots.tokens,))
+            _branch_pool_workers = workers
+
+        return _branch_pool, _branch_cancel_slots
 
-        for input_obj in self.inputs.values():
-            if input_obj is not None:
-                input_obj.on_solution_path = True
-                predecessor_method = input_obj.output_of
-                if predecessor_method is not None:
-                    if not predecessor_method.on_solution_path:
-                        predecessor_method.color_as_on_solution_path()
 
+def shutdown_branch_pool():
+    # before the interpreter tears down the modules the pool still needs
+    global _branch_pool
+    with _branch_pool_lock:
+        if _branch_pool is not None:
+            _branch_pool.shutdown()
+            _branch_pool = None
 
-def flood_fill(solution_graph: RTSolutionGraph, knowledge_graph: RTGraph, choice_space: RTChoiceSpace, start_objects: List[RTObjectInstance]):
+
+def flood_choice_space(solution_graph: RTSolutionGraph, knowledge_graph: RTGraph, task: RTSearchTask,
+                       options: RTSearchOptions) -> List[RTSearchTask]:
     # exhaust every combination while only using objects in the current choice space
     # like this: starting with set of 'fresh' (so far unused) objects, try all possible combinations that use these
     # objects in at least one input
@@ -162,113 +1072,273 @@ def flood_fill(solution_graph: RTSolutionGraph, knowledge_graph: RTGraph, choice
     # while doing that, remember all newly generated objects with more narrow choice space (future_objects)
 
     # if any generated object (in current choice space) matches the target spec, return
+    # (unless searching exhaustively; with a solution limit, generated objects are checked as soon as they are created)
 
     # otherwise, at some point all combinations will have been exhausted
     # now it gets somewhat complicated
     # look at all future_objects and extract all methods with choices and the respective possible options
-    # then, for each subsequent choice space run flood_fill
+    # then, return a search task for each subsequent choice space
     # the 'fresh' objects to start with are all future_objects in the respective choice space
-    print(choice_space)
-    fresh_objects = start_objects
+    choice_space = task.choice_space
+    encoder = solution_graph.choice_space_encoder
+    fresh_objects = task.start_objects
     new_fresh_objects = []
     future_objects = []
     subsequent_choice_spaces = []
 
     while fresh_objects:
         for fresh_object in fresh_objects:
-            if object_matches_input_spec(fresh_object, solution_graph.target_spec):
-                fresh_object.is_end = True
-                if fresh_object.output_of:
-                    fresh_object.output_of.color_as_on_solution_path()
-                return
+            if fresh_object.is_end or (solution_graph.target_spec is not None
+                                       and object_matches_input_spec(fresh_object, solution_graph.target_spec)):
+                if not fresh_object.is_end:
+                    solution_graph.add_end_object(fresh_object)
+                if not options.exhaustive or options.enough_solutions(solution_graph):
+                    return []
+
+            for method_def, dict_of_lists in method_candidates(solution_graph, knowledge_graph, choice_space, fresh_object):
+                for inputs in input_combinations(dict_of_lists, encoder):
+                    exceeded_limit = options.budget.exceeded(solution_graph)
+                    if exceeded_limit is not None:
+                        solution_graph.mark_partial(exceeded_limit)
+                        return []
 
-            for method_name, method_def in knowledge_graph.methods.items():
-                for input_name, input_spec in method_def.inputs.items():
-                    if input_spec.tune:
+                    new_method_instance = apply_method(solution_graph, choice_space, method_def, inputs,
+                                                       subsequent_choice_spaces)
+                    if new_method_instance is None:
                         continue
 
-                    if object_matches_input_spec(fresh_object, input_spec):
-                        # this input on this method would accept this fresh object
-                        # now find all combinations of how the other inputs could be filled
-                        dict_of_lists = {input_name: [fresh_object]}
-                        for other_input_name, other_input_spec in method_def.inputs.items():
-                            if other_input_name == input_name or other_input_spec.tune:
-                                continue
-
-                            dict_of_lists[other_input_name] = [obj
-                                                               for obj
-                                                               in solution_graph.get_objects_in_choice_space(choice_space)
-                                                               if object_matches_input_spec(obj, other_input_spec)]
-
-                        list_of_dicts = dict_cartesian(dict_of_lists)
-
-                        for inputs in list_of_dicts:
-                            # instantiate method and its output objects
-                            outputs = {}
-                            for option_name, output_option in method_def.outputs.items():
-                                outputs[option_name] = {}
-                                for output_name, output_def in output_option.items():
-                                    outputs[option_name][output_name] = RTObjectInstance("o" + str(solution_graph.next_id()), output_def.type, {}, {}, None)
-                            new_method_instance = RTMethodInstance(method_def, "m" + str(solution_graph.next_id()), inputs, outputs)
-                            new_method_instance.propagate()
-
-                            # test whether we actually gained anything new from this (and set output_of)
-                            method_adds_new_object = False
-                            for option_name in outputs:
-                                for output_name in outputs[option_name]:
-                                    output_obj = new_method_instance.outputs[option_name][output_name]
-                                    output_obj.output_of = new_method_instance
-
-                                    object_is_redundant = False
-                                    for old_obj in solution_graph.get_objects_in_choice_space(choice_space):
-                                        if new_object_is_redundant(old_obj, output_obj):
-                                            object_is_redundant = True
-
-                                    if not object_is_redundant:
-                                        method_adds_new_object = True
-                                        if len(outputs) > 1 and output_obj.choice_space not in subsequent_choice_spaces:
-                                            subsequent_choice_spaces.append(output_obj.choice_space)
-
-                            if method_adds_new_object:
-                                # add new method and objects to graph
-                                solution_graph.method_instances[new_method_instance.name] = new_method_instance
-                                for option_name in outputs:
-                                    for output_name in outputs[option_name].keys():
-                                        output_obj = new_method_instance.outputs[option_name][output_name]
-                                        solution_graph.object_instances[output_obj.name] = output_obj
-
-                                        if output_obj.in_choice_space(choice_space):
-                                            new_fresh_objects.append(output_obj)
-                                        else:
-                                            future_objects.append(output_obj)
+                    branch_solved = False
+                    for output_obj in new_method_instance.output_objects():
+                        if encoder.contains(choice_space, output_obj.choice_space):
+                            new_fresh_objects.append(output_obj)
+                        else:
+                            future_objects.append(output_obj)
+
+                        # early check, without waiting for the object to come up as fresh
+                        if options.max_solutions is not None and not options.enough_solutions(solution_graph) \
+                                and solution_graph.target_spec is not None \
+                                and object_matches_input_spec(output_obj, solution_graph.target_spec):
+                            solution_graph.add_end_object(output_obj)
+                            if not options.exhaustive and encoder.contains(choice_space, output_obj.choice_space):
+                                branch_solved = True
+
+                    if branch_solved or options.enough_solutions(solution_graph):
+                        return []
 
         fresh_objects = new_fresh_objects
         new_fresh_objects = []
+        if options.progress is not None and fresh_objects:
+            options.progress(solution_graph)
+
+    return subsequent_tasks(solution_graph, task, future_objects, subsequent_choice_spaces)
+
+
+def best_first_choice_space(solution_graph: RTSolutionGraph, knowledge_graph: RTGraph, task: RTSearchTask,
+                            options: RTSearchOptions, derivations: Dict[str, FrozenSet[str]],
+                            method_costs: Dict[str, float], expanded: Set[str]) -> List[RTSearchTask]:
+    # same as flood_choice_space, but instead of implementing every combination right away, queue them and always
+    # implement the one with the lowest cost so far plus (lower bound of the) cost of its outputs to the target
+    # objects are thereby created in the order of their cost, so the redundancy check keeps the cheapest derivation
+    # and the first object matching the target ends the cheapest method chain
+    choice_space = task.choice_space
+    encoder = solution_graph.choice_space_encoder
+    target_distances = knowledge_graph.type_distances[solution_graph.target_spec.type.name]
+    open_combinations = []
+    counter = itertools.count()
+    future_objects = []
+    subsequent_choice_spaces = []
+
+    def reached_target(obj: RTObjectInstance) -> bool:
+        if obj.is_end or object_matches_input_spec(obj, solution_graph.target_spec):
+            if not obj.is_end:
+                solution_graph.add_end_object(obj)
+            return not options.exhaustive or options.enough_solutions(solution_graph)
+        return False
+
+    def expand(obj: RTObjectInstance):
+        # queue all combinations of obj with objects expanded before
+        expanded.add(obj.name)
+        for method_def, dict_of_lists in method_candidates(solution_graph, knowledge_graph, choice_space, obj,
+                                                           lambda other_obj: other_obj.name in expanded):
+            output_distances = [target_distances[output_def.type.name]
+                                for output_option in method_def.outputs.values()
+                                for output_def in output_option.values()
+                                if output_def.type.name in target_distances]
+            if not output_distances:
+                continue  # no output leads to the target
+
+            for inputs in input_combinations(dict_of_lists, encoder):
+                derivation = frozenset().union(*(derivations[input_obj.name] for input_obj in inputs.values()))
+                cost = method_def.cost + sum(method_costs[method_name] for method_name in derivation)
+                # prefer deeper combinations on ties, they are closer to a solution
+                heapq.heappush(open_combinations, (cost + min(output_distances), -cost, next(counter), method_def,
+                                                   inputs, derivation))
+
+    for obj in task.start_objects:
+        if obj.name in expanded:
+            continue
+        if reached_target(obj):
+            return []
+        expand(obj)
+
+    while open_combinations:
+        *_, method_def, inputs, derivation = heapq.heappop(open_combinations)
+        exceeded_limit = options.budget.exceeded(solution_graph)
+        if exceeded_limit is not None:
+            solution_graph.mark_partial(exceeded_limit)
+            return []
+
+        new_method_instance = apply_method(solution_graph, choice_space, method_def, inputs, subsequent_choice_spaces)
+        if new_method_instance is None:
+            continue
+
+        method_costs[new_method_instance.name] = method_def.cost
+        derivation = derivation | {new_method_instance.name}
+        for output_obj in new_method_instance.output_objects():
+            derivations[output_obj.name] = derivation
+            if not encoder.contains(choice_space, output_obj.choice_space):
+                future_objects.append(output_obj)
+            elif reached_target(output_obj):
+                return []
+            else:
+                expand(output_obj)
+
+    return subsequent_tasks(solution_graph, task, future_objects, subsequent_choice_spaces)
+
+
+# values of RTSearchOptions.strategy
+SEARCH_STRATEGIES = {
+    'flood': flood_fill,
+    'best_first': best_first_fill
+}
+
+
+def method_candidates(solution_graph: RTSolutionGraph, knowledge_graph: RTGraph, choice_space: RTChoiceSpace,
+                      obj: RTObjectInstance, partner_filter: Optional[Callable[[RTObjectInstance], bool]] = None
+                      ) -> Iterator[Tuple[RTMethod, Dict[str, List[RTObjectInstance]]]]:
+    """
+    Yield every method with an input accepting obj, together with the candidates for each of its inputs: obj for the
+    accepting input and the matching objects of the choice space for the others, optionally filtered by partner_filter
+    """
+    relevant_methods = solution_graph.relevant_methods
+    for method_def, input_name, input_spec in knowledge_graph.inputs_by_type[obj.type.name]:
+        if relevant_methods is not None and method_def.name not in relevant_methods:
+            continue
+
+        if object_matches_input_spec(obj, input_spec):
+            # this input on this method would accept this object
+            # now find all combinations of how the other inputs could be filled
+            dict_of_lists = {input_name: [obj]}
+            for other_input_name, other_input_spec in method_def.inputs.items():
+                if other_input_name == input_name or other_input_spec.tune:
+                    continue
+
+                dict_of_lists[other_input_name] = [other_obj
+                                                   for other_obj
+                                                   in solution_graph.get_objects_in_choice_space(choice_space, other_input_spec.type)
+                                                   if object_matches_input_spec(other_obj, other_input_spec)
+                                                   and (partner_filter is None or partner_filter(other_obj))]
+
+            yield method_def, dict_of_lists
+
+
+def apply_method(solution_graph: RTSolutionGraph, choice_space: RTChoiceSpace, method_def: RTMethod,
+                 inputs: Dict[str, RTObjectInstance], subsequent_choice_spaces: List[RTChoiceSpace]
+                 ) -> Optional[RTMethodInstance]:
+    """
+    Instantiate the method on the inputs and add it to the solution graph, unless all of its outputs are redundant.
+    Choice spaces of new branches are appended to subsequent_choice_spaces.
+    Returns the new method instance, None if it was dropped.
+    """
+    # instantiate method and its output objects
+    outputs = {}
+    for option_name, output_option in method_def.outputs.items():
+        outputs[option_name] = {}
+        for output_name, output_def in output_option.items():
+            outputs[option_name][output_name] = RTObjectInstance("o" + str(solution_graph.next_id()), output_def.type, {}, {}, None)
+    new_method_instance = RTMethodInstance(method_def, "m" + str(solution_graph.next_id()), inputs, outputs)
+    new_method_instance.propagate()
+
+    # test whether we actually gained anything new from this (and set output_of)
+    method_adds_new_object = False
+    for output_obj in new_method_instance.output_objects():
+        output_obj.output_of = new_method_instance
+
+        if not solution_graph.is_redundant(output_obj, choice_space):
+            method_adds_new_object = True
+            if len(outputs) > 1 and output_obj.choice_space not in subsequent_choice_spaces:
+                subsequent_choice_spaces.append(output_obj.choice_space)
 
+    if not method_adds_new_object:
+        return None
+
+    # add new method and objects to graph
+    solution_graph.method_instances[new_method_instance.name] = new_method_instance
+    for output_obj in new_method_instance.output_objects():
+        solution_graph.add_object(output_obj)
+
+    return new_method_instance
+
+
+def subsequent_tasks(solution_graph: RTSolutionGraph, task: RTSearchTask, future_objects: List[RTObjectInstance],
+                     subsequent_choice_spaces: List[RTChoiceSpace]) -> List[RTSearchTask]:
+    """
+    One task per branch found while searching the task, starting from the future objects valid in the branch
+    """
     if not future_objects:
-        return
+        return []
 
-    for subsequent_choice_space in subsequent_choice_spaces:
-        subsequent_start_objects = [obj for obj in future_objects if obj.in_choice_space(subsequent_choice_space)]
-        flood_fill(solution_graph, knowledge_graph, subsequent_choice_space, subsequent_start_objects)
+    encoder = solution_graph.choice_space_encoder
+    return [
+        RTSearchTask(subsequent_choice_space,
+                     [obj for obj in future_objects if encoder.contains(subsequent_choice_space, obj.choice_space)],
+                     depth=task.depth + 1, index=i)
+        for i, subsequent_choice_space in enumerate(subsequent_choice_spaces)
+    ]
 
 
 def object_matches_input_spec(o: RTObjectInstance, input_spec: RTMethodInput):
-    if o.type != input_spec.type:
+    # types are unique by name within a graph, comparing the whole definitions is much slower
+    if o.type.name != input_spec.type.name:
         return False
 
-    for param_name, constraint in input_spec.param_constraints.items():
-        if isinstance(constraint, RTParamPlaceholder):
-            continue
-        elif isinstance(constraint, RTParamUnset):
-            if param_name in o.param_values:
-                return False
-        else:
-            if param_name not in o.param_values:
-                return False
-            elif (isinstance(constraint, int) or isinstance(constraint, RTEnumValue)) and o.param_values[param_name] != constraint:
-                return False
-    return True
+    return input_spec.matches_params(o.param_mask, o.param_vector)
+
+
+class RTParamMatrix:
+    """
+    Encoded params of a list of objects as NumPy arrays, built once to match the objects against many input specs.
+    Building the arrays costs about as much as matching every object once, so this only pays off for several specs.
+    """
+    def __init__(self, objects: List[RTObjectInstance]):
+        self.objects = objects
+        self.masks = None
+        self.vectors = None
+        if numpy is None or not objects or any(o.type.name != objects[0].type.name for o in objects):
+            return
+
+        try:
+            self.masks = numpy.array([o.param_mask for o in objects], dtype=numpy.int64)
+            self.vectors = numpy.array([o.param_vector for o in objects], dtype=numpy.int64)
+        except (OverflowError, TypeError, ValueError):
+            # more than 63 params, huge int values or placeholders do not fit into int64
+            self.masks = None
+            self.vectors = None
+
+    def matching(self, input_spec: RTMethodInput) -> List[RTObjectInstance]:
+        """
+        The objects matching the input spec, in their original order
+        """
+        if self.masks is None:
+            return [o for o in self.objects if object_matches_input_spec(o, input_spec)]
+        if self.objects[0].type.name != input_spec.type.name:
+            return []
+
+        matches = (self.masks & input_spec.unset_mask == 0) & (self.masks & input_spec.set_mask == input_spec.set_mask)
+        if input_spec.value_positions:
+            matches &= (self.vectors[:, list(input_spec.value_positions)] == input_spec.value_codes).all(axis=1)
+
+        return [self.objects[i] for i in numpy.flatnonzero(matches)]
 
 
 def new_object_is_redundant(old_object: RTObjectInstance, new_object: RTObjectInstance):
@@ -282,17 +1352,66 @@ def new_object_is_redundant(old_object: RTObjectInstance, new_object: RTObjectIn
     return True
 
 
-def dict_cartesian(dict_of_lists: Dict[str, List]):
+def input_combinations(dict_of_lists: Dict[str, List[RTObjectInstance]],
+                       encoder: Optional[RTChoiceSpaceEncoder] = None) -> Iterator[Dict[str, RTObjectInstance]]:
     """
-    Example: {'a': [1, 2], 'b': [3, 4, 5]} results in
-    [{'a': 1, 'b': 3}, {'a': 1, 'b': 4}, ..., {'a': 2, 'b': 5}]
+    Lazily yield every combination of one object per input, in the same order as itertools.product.
+    Combinations of objects with incompatible choice spaces are skipped before they are built, pass the encoder of the
+    solution graph to reuse the encoded choice spaces of its objects.
+    Example: {'a': [o1, o2], 'b': [o3]} yields {'a': o1, 'b': o3}, then {'a': o2, 'b': o3}
     """
-    return [
-        {
-            key: combination_tuple[i_key]
-            for i_key, key in enumerate(dict_of_lists.keys())
-        } for combination_tuple in itertools.product(*dict_of_lists.values())
-    ]
+    keys = list(dict_of_lists.keys())
+    lists = [dict_of_lists[key] for key in keys]
+    if not keys:
+        yield {}
+        return
+
+    if encoder is None:
+        encoder = RTChoiceSpaceEncoder()
+    encoded_lists = [[encoder.encode(obj.choice_space) for obj in objects] for objects in lists]
+
+    # iterative depth first search over the inputs, merging the encoded choice spaces of the chosen objects on the way
+    indices = [0] * len(keys)
+    merged_bits = [0] * (len(keys) + 1)
+    merged_masks = [0] * (len(keys) + 1)
+    level = 0
+    while level >= 0:
+        if indices[level] == len(lists[level]):
+            # all objects for this input tried, continue with the next object of the previous input
+            indices[level] = 0
+            level -= 1
+            if level >= 0:
+                indices[level] += 1
+            continue
+
+        bits, mask = encoded_lists[level][indices[level]]
+        if (bits ^ merged_bits[level]) & mask & merged_masks[level]:
+            # different options of the same method
+            indices[level] += 1
+        elif level == len(keys) - 1:
+            yield {key: lists[i][indices[i]] for i, key in enumerate(keys)}
+            indices[level] += 1
+        else:
+            merged_bits[level + 1] = merged_bits[level] | bits
+            merged_masks[level + 1] = merged_masks[level] | mask
+            level += 1
+
+
+def merge_choice_spaces(a: RTChoiceSpace, b: RTChoiceSpace) -> Optional[RTChoiceSpace]:
+    """
+    Combine the choices of both choice spaces, None if they contain different options for the same method
+    """
+    if not b:
+        return a
+    if not a:
+        return b
+
+    merged = a.copy()
+    for method_name, option in b.items():
+        if merged.setdefault(method_name, option) != option:
+            return None
+
+    return merged
 
 
 def dict_diff(a, b):
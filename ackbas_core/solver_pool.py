@@ -0,0 +1,329 @@
+"""
+Bounded process pool for solution searches, so long searches do not block the server process handling requests
+"""
+from __future__ import annotations
+
+import asyncio
+import atexit
+import collections
+import concurrent.futures
+import functools
+import itertools
+import multiprocessing
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from ackbas_core.solution_sketch import RTCancelSlots, RTCancelFlag, init_cancel_tokens
+
+
+class RTSolverPoolSaturated(Exception):
+    """
+    Raised instead of queueing a search when all workers are busy and the queue is full
+    """
+    pass
+
+
+class RTSolverStreamError(Exception):
+    """
+    Raised by RTSolverStream with the message of the exception the streaming function raised in its worker process
+    """
+    pass
+
+
+# the queue of a worker process of the solver pool the streaming functions send their items through
+_stream_queue: Optional[multiprocessing.Queue] = None
+
+
+def init_solver_process(stream_queue: multiprocessing.Queue, cancel_tokens):
+    global _stream_queue
+    _stream_queue = stream_queue
+    init_cancel_tokens(cancel_tokens)
+
+
+class RTStreamChannel:
+    """
+    Handed to the function of RTSolverPool.stream in its worker process. send() passes an item to the caller and
+    is_set() tells whether the caller stopped listening, so the channel can be the cancel_event of a search budget.
+    """
+    __slots__ = ('stream_id', 'cancel_flag')
+
+    def __init__(self, stream_id: int, cancel_flag: RTCancelFlag):
+        self.stream_id = stream_id
+        self.cancel_flag = cancel_flag
+
+    def send(self, item):
+        _stream_queue.put((self.stream_id, 'item', item))
+
+    def is_set(self) -> bool:
+        return self.cancel_flag.is_set()
+
+
+def run_streaming(channel: RTStreamChannel, func: Callable, *args):
+    # the end of the stream goes through the same queue as its items, so it cannot overtake them
+    try:
+        func(channel, *args)
+    except Exception as e:
+        _stream_queue.put((channel.stream_id, 'error', str(e)))
+    else:
+        _stream_queue.put((channel.stream_id, 'end', None))
+
+
+class RTSolverStream:
+    """
+    Async iterator over the items a call of RTSolverPool.stream sends. It is not bound to an event loop, so it can be
+    iterated in another one than it was opened in. close() stops the call, iterating to the end closes it as well.
+    """
+    def __init__(self, pool: RTSolverPool, stream_id: int, cancel_slots: RTCancelSlots, slot: Tuple[int, int]):
+        self.pool = pool
+        self.stream_id = stream_id
+        self.future: Optional[concurrent.futures.Future] = None
+        self.deadline = None if pool.timeout is None else time.monotonic() + pool.timeout
+        self._cancel_slots = cancel_slots
+        self._slot = slot
+        self._messages = collections.deque()  # (kind, payload) as sent by run_streaming or 'failed' and the exception
+        self._waiter: Optional[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = None
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while True:
+            loop = asyncio.get_running_loop()
+            with self._lock:
+                if self._closed:
+                    raise StopAsyncIteration
+                if self._messages:
+                    kind, payload = self._messages.popleft()
+                else:
+                    kind, payload = None, None
+                    waiter = loop.create_future()
+                    self._waiter = loop, waiter
+
+            if kind == 'item':
+                return payload
+            if kind is not None:
+                self.close()
+                if kind == 'error':
+                    raise RTSolverStreamError(payload)
+                if kind == 'failed':
+                    raise payload
+                raise StopAsyncIteration
+
+            timeout = None if self.deadline is None else max(self.deadline - time.monotonic(), 0)
+            try:
+                await asyncio.wait_for(waiter, timeout)
+            except asyncio.TimeoutError:
+                with self.pool._lock:
+                    self.pool.timed_out += 1
+                self.close()
+                raise
+
+    def put(self, kind: str, payload: Any):
+        # called from the thread reading the items of all streams and from the callbacks of the future
+        with self._lock:
+            self._messages.append((kind, payload))
+            waiter, self._waiter = self._waiter, None
+        if waiter is not None:
+            loop, future = waiter
+            try:
+                loop.call_soon_threadsafe(RTSolverStream.wake, future)
+            except RuntimeError:
+                pass  # the loop is closed, nobody is waiting anymore
+
+    @staticmethod
+    def wake(future: asyncio.Future):
+        if not future.done():
+            future.set_result(None)
+
+    def finished(self, future: concurrent.futures.Future):
+        # a normal end arrives through the queue, the future only reports calls that never got to send it
+        if future.cancelled():
+            self.put('failed', asyncio.CancelledError())
+        elif future.exception() is not None:
+            self.put('failed', future.exception())
+
+    def close(self):
+        """
+        Stop listening, the call stops once the search notices or right away if it is still in the queue
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        if self.future is not None:
+            self.future.cancel()
+        self._cancel_slots.release(self._slot)
+        with self.pool._lock:
+            self.pool._streams.pop(self.stream_id, None)
+
+
+class RTSolverPool:
+    """
+    Runs functions in worker processes, with at most max_queue calls waiting for a free worker.
+    A call counts against the limit until its process is done with it, even if the caller stopped waiting.
+    Calls can also send items back while they run, see stream.
+    """
+    def __init__(self, workers: int = 2, max_queue: int = 8, timeout: Optional[float] = None):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout  # seconds a caller waits for a result, including the time in the queue
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._in_flight = 0
+        self._executor: Optional[concurrent.futures.ProcessPoolExecutor] = None
+        # started together with the executor, the processes get them when they start
+        self._stream_queue: Optional[multiprocessing.Queue] = None
+        self._dispatcher: Optional[threading.Thread] = None
+        self._cancel_slots: Optional[RTCancelSlots] = None
+        self._streams: Dict[int, RTSolverStream] = {}
+        self._stream_ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    async def run(self, func: Callable, *args) -> Any:
+        """
+        Call func(*args) in a worker process and return its result.
+        Raises RTSolverPoolSaturated if the queue is full and asyncio.TimeoutError if there is no result in time.
+        """
+        with self._lock:
+            executor = self._admit()
+
+        try:
+            future = executor.submit(func, *args)
+        except concurrent.futures.process.BrokenProcessPool:
+            self._release(executor, None)
+            raise
+        future.add_done_callback(functools.partial(self._release, executor))
+
+        try:
+            # on timeout, a call still waiting in the queue is cancelled, a running one keeps its worker until done
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.timed_out += 1
+            raise
+
+    def stream(self, func: Callable, *args) -> RTSolverStream:
+        """
+        Call func(channel, *args) in a worker process, channel being an RTStreamChannel, and return the stream of the
+        items it sends. Raises RTSolverPoolSaturated like run. Iterating the stream raises asyncio.TimeoutError if
+        the call does not end within the timeout and RTSolverStreamError if func raises.
+        """
+        with self._lock:
+            executor = self._admit()
+            cancel_slots = self._cancel_slots
+            # there are as many slots as calls can be in flight, so there is always one left
+            slot = cancel_slots.acquire()
+            stream = RTSolverStream(self, next(self._stream_ids), cancel_slots, slot)
+            self._streams[stream.stream_id] = stream
+
+        channel = RTStreamChannel(stream.stream_id, RTCancelFlag(*slot))
+        try:
+            stream.future = executor.submit(run_streaming, channel, func, *args)
+        except concurrent.futures.process.BrokenProcessPool:
+            self._release(executor, None)
+            stream.close()
+            raise
+        stream.future.add_done_callback(functools.partial(self._release, executor))
+        stream.future.add_done_callback(stream.finished)
+        return stream
+
+    def _admit(self) -> concurrent.futures.ProcessPoolExecutor:
+        # with the lock held, count a new call or reject it
+        if self._in_flight >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise RTSolverPoolSaturated(f"All {self.workers} workers are busy and {self.max_queue} searches are waiting")
+
+        if self._executor is None:
+            self._stream_queue = multiprocessing.Queue()
+            self._cancel_slots = RTCancelSlots(self.workers + self.max_queue)
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.workers, initializer=init_solver_process,
+                initargs=(self._stream_queue, self._cancel_slots.tokens))
+            self._dispatcher = threading.Thread(target=self._dispatch, args=(self._stream_queue,), daemon=True)
+            self._dispatcher.start()
+            # before the interpreter tears down the modules the pool still needs
+            atexit.register(self.shutdown)
+        self._in_flight += 1
+        return self._executor
+
+    def _dispatch(self, stream_queue: multiprocessing.Queue):
+        # hands the items sent by the worker processes to their streams, until None comes in
+        while True:
+            message = stream_queue.get()
+            if message is None:
+                return
+            stream_id, kind, payload = message
+            with self._lock:
+                stream = self._streams.get(stream_id)
+            if stream is not None:
+                stream.put(kind, payload)
+
+    def _release(self, executor: concurrent.futures.ProcessPoolExecutor, future: Optional[concurrent.futures.Future]):
+        # future is None if the call could not even be submitted because the executor is broken
+        broken = future is None or (not future.cancelled() and
+                                    isinstance(future.exception(), concurrent.futures.process.BrokenProcessPool))
+        with self._lock:
+            self._in_flight -= 1
+            if future is not None and not future.cancelled() and not broken:
+                self.completed += 1
+            if broken and self._executor is executor:
+                # a worker died, start over with new processes for the next call, the broken executor already
+                # terminated its processes
+                self._executor = None
+                self._stream_queue.put(None)
+
+    def shutdown(self):
+        with self._lock:
+            executor = self._executor
+            self._executor = None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+            self._stream_queue.put(None)
+            # the queue must not be closed at exit while the thread still reads from it
+            self._dispatcher.join(1.0)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'in_flight': self._in_flight,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'streams': len(self._streams),
+                'workers': self.workers,
+                'max_queue': self.max_queue
+            }
+
+
+_solver_pool = None
+_solver_pool_lock = threading.Lock()
+
+
+def get_solver_pool() -> RTSolverPool:
+    """
+    Return the pool configured in settings.SOLVER_POOL
+    """
+    global _solver_pool
+    with _solver_pool_lock:
+        if _solver_pool is None:
+            _solver_pool = RTSolverPool(**settings.SOLVER_POOL)
+
+        return _solver_pool
+
+
+@receiver(setting_changed)
+def reset_solver_pool(setting, **kwargs):
+    global _solver_pool
+    if setting == 'SOLVER_POOL':
+        with _solver_pool_lock:
+            if _solver_pool is not None:
+                _solver_pool.shutdown()
+            _solver_pool = None
@@ -1,9 +1,198 @@
-from django.test import TestCase
+import asyncio
+import json
+import marshal
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
 
-from ackbas_core.knowledge_graph import RTGraph, RTEnumType, RTParamPlaceholder, RTParamUnset, RTEnumValue
-from ackbas_core.solution_sketch import RTObjectInstance
+import jsonschema
+import yaml
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.test import TestCase, SimpleTestCase, override_settings
+
+from ackbas_core.knowledge_graph import RTGraph, RTEnumType, RTParamPlaceholder, RTParamUnset, RTEnumValue, \
+    RTGraphRegistry, RTMethodInput, RTLoadError, validate_graph_content, get_schema_validator, compile_graph, \
+    compiled_path_for, compiled_header, load_compiled_graph, RTCompiledGraphError, _validated_hashes
+from ackbas_core.solution_sketch import RTObjectInstance, RTSolutionGraph, RTMethodInstance, RTSearchQueue, flood_fill, \
+    input_combinations, RTSearchOptions, RTSearchBudget, object_matches_input_spec, RTParamMatrix, RTChoiceSpaceEncoder, \
+    freeze_choice_space, best_first_fill, RTFrozenDict, dumps_with_graph, loads_with_graph, search_closure, \
+    RTCancelSlots, RTCancelFlag, init_cancel_tokens
+from ackbas_core.solution_cache import RTLocalSolutionCache, get_solution_cache
+from ackbas_core.solver_pool import RTSolverPool, RTSolverPoolSaturated, RTSolverStreamError, get_solver_pool
+from ackbas_core.async_streaming import RTASGIHandler
+from ackbas_core.single_flight import RTSingleFlight
 from ackbas_core.views import GetSolutionGraphView
 
+# a direct but expensive method and a cheaper chain of two methods
+COST_GRAPH_YML = """
+enums: {}
+
+types:
+  Start: {}
+  Middle: {}
+  Goal: {}
+
+methods:
+  Direct:
+    cost: 5
+    inputs:
+      start:
+        type: Start
+    outputs:
+      optionOne:
+        goal:
+          type: Goal
+  FirstStep:
+    inputs:
+      start:
+        type: Start
+    outputs:
+      optionOne:
+        middle:
+          type: Middle
+  SecondStep:
+    cost: 1.5
+    inputs:
+      middle:
+        type: Middle
+    outputs:
+      optionOne:
+        goal:
+          type: Goal
+"""
+
+# joining two results of the same expensive step costs 10 + 1 + 1 + 1, less than Direct, if Expensive is counted once
+SHARED_COST_GRAPH_YML = """
+enums: {}
+
+types:
+  Start: {}
+  Shared: {}
+  Left: {}
+  Right: {}
+  Goal: {}
+
+methods:
+  Direct:
+    cost: 13.5
+    inputs:
+      start:
+        type: Start
+    outputs:
+      optionOne:
+        goal:
+          type: Goal
+  Expensive:
+    cost: 10
+    inputs:
+      start:
+        type: Start
+    outputs:
+      optionOne:
+        shared:
+          type: Shared
+  ToLeft:
+    inputs:
+      shared:
+        type: Shared
+    outputs:
+      optionOne:
+        left:
+          type: Left
+  ToRight:
+    inputs:
+      shared:
+        type: Shared
+    outputs:
+      optionOne:
+        right:
+          type: Right
+  Join:
+    inputs:
+      left:
+        type: Left
+      right:
+        type: Right
+    outputs:
+      optionOne:
+        goal:
+          type: Goal
+"""
+
+# the output has the name of the input but a type without its param
+RENAME_GRAPH_YML = """
+enums: {}
+
+types:
+  A:
+    params:
+      P:
+        type: Int
+  B: {}
+
+methods:
+  Rename:
+    inputs:
+      obj:
+        type: A
+        params:
+          P: n
+    outputs:
+      optionOne:
+        obj:
+          type: B
+"""
+
+# copies its param unchanged, for chains of methods
+COPY_GRAPH_YML = """
+enums: {}
+
+types:
+  T:
+    params:
+      P:
+        type: Int
+
+methods:
+  Copy:
+    inputs:
+      x:
+        type: T
+        params:
+          P: n
+    outputs:
+      optionOne:
+        x:
+          type: T
+"""
+
+
+def send_numbers(channel, n: int):
+    for i in range(n):
+        channel.send(i)
+
+
+def send_until_cancelled(channel):
+    channel.send('started')
+    while not channel.is_set():
+        time.sleep(0.01)
+
+
+def fail_after_sending(channel):
+    channel.send('started')
+    raise ValueError("search failed")
+
+
+def load_cost_graph(tmp_dir: str, yml: str = COST_GRAPH_YML) -> RTGraph:
+    yml_path = os.path.join(tmp_dir, 'costs.yml')
+    with open(yml_path, 'w', encoding='utf8') as f:
+        f.write(yml)
+    return RTGraph(yml_path)
+
 
 class KnowledgeGraphTest(TestCase):
     def test_load_from_yml(self):
@@ -27,8 +216,209 @@ class KnowledgeGraphTest(TestCase):
         self.assertIsInstance(graph.methods["TestProperty"].outputs["optionGood"]["objectTwo"].param_statements["ValueEnum"], RTEnumValue)
         self.assertEqual(graph.methods["TestProperty"].outputs["optionGood"]["objectTwo"].param_statements["ValueEnum"].val, 0)
 
+        # tune inputs are not indexed since the search never fills them
+        self.assertListEqual([(method.name, input_name) for method, input_name, _ in graph.inputs_by_type["TypeTwo"]],
+                             [("TestProperty", "objectTwo"), ("Correct", "objectTwo"), ("Combine", "objectTwo")])
+        self.assertListEqual(graph.inputs_by_type["TypeWithoutParams"], [])
+
+        # display YML is generated on first access
+        self.assertIsInstance(graph.types["TypeTwo"].yaml_source, dict)
+        self.assertIn("ValueEnum", graph.types["TypeTwo"].yaml)
+        self.assertIsInstance(graph.types["TypeTwo"].yaml_source, str)
+        self.assertIn("Converts one type into another", graph.methods["Convert"].yaml)
+
+    def test_param_bindings(self):
+        graph = RTGraph('minimal.yml')
+
+        combine_bindings = graph.methods["Combine"].outputs["optionOne"]["objectThree"].param_bindings
+        self.assertEqual(len(combine_bindings), 1)
+        self.assertEqual(combine_bindings[0].param_name, "ValueThree")
+        self.assertListEqual(combine_bindings[0].sources, [("objectTwo", "ValueTwo")])
+
+        test_bindings = graph.methods["TestProperty"].outputs["optionBad"]["objectTwo"].param_bindings
+        self.assertEqual(test_bindings[0].literal.val, 1)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            yml_path = os.path.join(tmp_dir, 'graph.yml')
+            with open('minimal.yml', 'r', encoding='utf8') as f:
+                yml = f.read()
+            with open(yml_path, 'w', encoding='utf8') as f:
+                f.write(yml.replace("ValueThree: x", "ValueThree: y"))
+
+            with self.assertRaises(RTLoadError):
+                RTGraph(yml_path)
+
+    def test_validation(self):
+        self.assertIs(get_schema_validator(), get_schema_validator())
+
+        invalid_content = {"enums": {}, "types": {"lowercase": {}}, "methods": {}}
+        with self.assertRaises(jsonschema.ValidationError):
+            validate_graph_content(invalid_content, "invalid", trusted=True)
+
+        # trusted mode only skips the check for contents that were validated before
+        graph = RTGraph('minimal.yml')
+        validate_graph_content(invalid_content, graph.content_hash, trusted=True)
+        with self.assertRaises(jsonschema.ValidationError):
+            validate_graph_content(invalid_content, graph.content_hash)
+
+    def test_compiled_graph(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            yml_path = os.path.join(tmp_dir, 'graph.yml')
+            shutil.copy('minimal.yml', yml_path)
+
+            compiled_path = compile_graph(yml_path)
+            self.assertEqual(compiled_path, compiled_path_for(yml_path))
+
+            yml_graph = RTGraph(yml_path, use_compiled=False)
+            compiled_graph = RTGraph(yml_path)
+            self.assertEqual(compiled_graph.content_hash, yml_graph.content_hash)
+            self.assertEqual(compiled_graph.types, yml_graph.types)
+            self.assertEqual(compiled_graph.methods, yml_graph.methods)
+
+            # an outdated compiled file is ignored
+            with open(yml_path, 'r', encoding='utf8') as f:
+                yml = f.read()
+            with open(yml_path, 'w', encoding='utf8') as f:
+                f.write(yml.replace("  TypeWithoutParams: {}", "  TypeWithoutParams: {}\n  TypeExtra: {}"))
+            self.assertIn("TypeExtra", RTGraph(yml_path).types)
+
+            # damaged files are replaced while loading from the YML
+            for damage in (lambda data: data[:-10], lambda data: data[:4], lambda data: data[:-10] + b'x' * 10):
+                compile_graph(yml_path)
+                with open(compiled_path, 'rb') as f:
+                    data = f.read()
+                with open(compiled_path, 'wb') as f:
+                    f.write(damage(data))
+                with self.assertRaises(RTCompiledGraphError):
+                    load_compiled_graph(compiled_path, yml_graph.content_hash)
+                self.assertIn("TypeExtra", RTGraph(yml_path).types)
+                self.assertIsNotNone(load_compiled_graph(compiled_path, RTGraph(yml_path, use_compiled=False).content_hash))
+
+            # without trusted, the contents of a compiled file are validated again
+            compile_graph(yml_path)
+            with open(compiled_path, 'rb') as f:
+                data = f.read()
+            payload = marshal.loads(data[len(compiled_header(0)):])
+            payload['content']['types']['TypeExtra'] = 'not a type'
+            payload = marshal.dumps(payload)
+            with open(compiled_path, 'wb') as f:
+                f.write(compiled_header(len(payload)) + payload)
+            with self.assertRaises(jsonschema.exceptions.ValidationError):
+                RTGraph(yml_path)
+            # trusted only skips the check for contents validated in this process
+            _validated_hashes.clear()
+            with self.assertRaises(jsonschema.exceptions.ValidationError):
+                RTGraph(yml_path, trusted=True)
+
+            # compiling writes through temporary files of its own, none are left behind
+            self.assertEqual([name for name in os.listdir(tmp_dir) if name.endswith('.tmp')], [])
+
+    def test_reachability(self):
+        graph = RTGraph('minimal.yml')
+
+        # tune inputs do not count, so TypeWithoutParams leads nowhere
+        self.assertDictEqual(graph.type_distances["TypeThree"], {"TypeThree": 0, "TypeOne": 1, "TypeTwo": 1})
+        self.assertDictEqual(graph.type_distances["TypeOne"], {"TypeOne": 0})
+        self.assertEqual(graph.methods_reaching["TypeTwo"], {"Convert", "TestProperty", "Correct", "Useless"})
+
+        # backwards from the spec, Correct is ruled out since it always sets ValueEnum to One
+        enum_two = graph.instantiate_param(graph.param_types["MyEnum"], "Two")
+        spec = RTMethodInput(graph.types["TypeTwo"], {"ValueEnum": enum_two})
+        self.assertEqual(graph.relevant_methods(spec), graph.methods_reaching["TypeTwo"])
+        self.assertEqual(graph.relevant_methods(spec, bidirectional=True), {"Convert", "TestProperty", "Useless"})
+
+    def test_method_costs(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            graph = load_cost_graph(tmp_dir)
+
+        self.assertEqual(graph.methods["Direct"].cost, 5)
+        self.assertEqual(graph.methods["FirstStep"].cost, 1)
+        # distances are the cheapest cost to the target, not the fewest methods
+        self.assertDictEqual(graph.type_distances["Goal"], {"Goal": 0, "Middle": 1.5, "Start": 2.5})
+
+        with self.assertRaises(jsonschema.ValidationError):
+            validate_graph_content(yaml.safe_load(COST_GRAPH_YML.replace("cost: 5", "cost: -5")), "negative cost")
+
+    def test_registry(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            yml_path = os.path.join(tmp_dir, 'graph.yml')
+            shutil.copy('minimal.yml', yml_path)
+
+            registry = RTGraphRegistry(max_size=1)
+            graph = registry.get(yml_path)
+            self.assertIs(registry.get(yml_path), graph)
+            self.assertEqual(registry.stats()['hits'], 1)
+            self.assertEqual(registry.stats()['misses'], 1)
+
+            # touching the file without changing it keeps the cached graph
+            os.utime(yml_path, ns=(0, 0))
+            self.assertIs(registry.get(yml_path), graph)
+
+            # changed contents force a reload
+            with open(yml_path, 'a', encoding='utf8') as f:
+                f.write("\n# changed\n")
+            changed_graph = registry.get(yml_path)
+            self.assertIsNot(changed_graph, graph)
+            self.assertNotEqual(changed_graph.content_hash, graph.content_hash)
+
+            # least recently used graph is evicted
+            registry.get('minimal.yml')
+            self.assertEqual(registry.stats()['size'], 1)
+            self.assertIsNot(registry.get(yml_path), changed_graph)
+
 
 class SolutionSketchTest(TestCase):
+    def test_choice_space_index(self):
+        graph = RTGraph('minimal.yml')
+        type_one = graph.types["TypeOne"]
+        type_two = graph.types["TypeTwo"]
+
+        start = RTObjectInstance("start", type_one, {}, {}, None)
+        solution_graph = RTSolutionGraph([start], graph.methods["Combine"].inputs["objectTwo"])
+        good = RTObjectInstance("good", type_two, {"m1": "optionGood"}, {}, None)
+        bad = RTObjectInstance("bad", type_two, {"m1": "optionBad"}, {}, None)
+        deeper = RTObjectInstance("deeper", type_one, {"m1": "optionGood", "m2": "optionOne"}, {}, None)
+        for obj in (good, bad, deeper):
+            solution_graph.add_object(obj)
+
+        self.assertListEqual(solution_graph.get_objects_in_choice_space({}), [start])
+        self.assertListEqual(solution_graph.get_objects_in_choice_space({"m1": "optionGood"}), [start, good])
+        self.assertListEqual(solution_graph.get_objects_in_choice_space({"m1": "optionGood", "m2": "optionOne"}),
+                             [start, good, deeper])
+        self.assertListEqual(solution_graph.get_objects_in_choice_space({"m1": "optionBad"}, type_two), [bad])
+
+    def test_redundancy_check(self):
+        graph = RTGraph('minimal.yml')
+        type_two = graph.types["TypeTwo"]
+        enum_one = graph.instantiate_param(graph.param_types["MyEnum"], "One")
+
+        known = RTObjectInstance("known", type_two, {"m1": "optionGood"}, {"ValueTwo": 3, "ValueEnum": enum_one}, None)
+        solution_graph = RTSolutionGraph([known], graph.methods["Combine"].inputs["objectTwo"])
+
+        def is_redundant(choice_space, param_values):
+            new_obj = RTObjectInstance("new", known.type, choice_space, param_values, None)
+            return solution_graph.is_redundant(new_obj, choice_space)
+
+        # an object with the same or fewer known params in a narrower choice space adds nothing
+        self.assertTrue(is_redundant({"m1": "optionGood"}, {"ValueTwo": 3, "ValueEnum": enum_one}))
+        self.assertTrue(is_redundant({"m1": "optionGood", "m2": "optionOne"}, {"ValueTwo": 3}))
+        # different params or a choice space where the known object is not valid are new
+        self.assertFalse(is_redundant({"m1": "optionGood"}, {"ValueTwo": 4}))
+        self.assertFalse(is_redundant({"m1": "optionBad"}, {"ValueTwo": 3}))
+        self.assertFalse(is_redundant({}, {"ValueTwo": 3}))
+
+        # many params are indexed as they are, not as every subset of them
+        param_names = [f"Param{chr(ord('A') + i)}" for i in range(24)]
+        params_yml = "".join(f"      {name}:\n        type: Int\n" for name in param_names)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            graph = load_cost_graph(tmp_dir, f"enums: {{}}\n\ntypes:\n  Wide:\n    params:\n{params_yml}\nmethods: {{}}\n")
+        wide = graph.types["Wide"]
+        known = RTObjectInstance("known", wide, {}, {name: i for i, name in enumerate(param_names)}, None)
+        solution_graph = RTSolutionGraph([known], RTMethodInput(wide, {}))
+        self.assertTrue(is_redundant({}, {name: i for i, name in enumerate(param_names) if i % 2 == 0}))
+        self.assertTrue(is_redundant({}, {name: i for i, name in enumerate(param_names)}))
+        self.assertFalse(is_redundant({}, {"ParamB": 1, "ParamC": 3}))
+
     def test_solution(self):
         start_dict = {
             "start": {
@@ -58,3 +448,744 @@ class SolutionSketchTest(TestCase):
             return all(constructable_from_start_objects(other_obj_id) for other_obj_id in preceeding_object_ids)
 
         self.assertTrue(all(constructable_from_start_objects(obj["id"]) for obj in sol["objects"] if obj["is_end"]))
+
+    def test_search_orders(self):
+        graph = RTGraph('minimal.yml')
+
+        for order in RTSearchQueue.orders:
+            start = RTObjectInstance("start", graph.types["TypeOne"], {}, {"ValueOne": 5}, None)
+            solution_graph = RTSolutionGraph([start], RTMethodInput(graph.types["TypeThree"], {}))
+            flood_fill(solution_graph, graph, {}, [start], RTSearchOptions(order=order))
+            solution_graph.prune()
+
+            end_objects = [obj for obj in solution_graph.object_instances.values() if obj.is_end]
+            self.assertTrue(end_objects, order)
+            self.assertTrue(all(obj.param_values["ValueThree"] in (5, 1337) for obj in end_objects), order)
+
+    def test_deep_chain(self):
+        # chains much longer than the recursion limit must not fail
+        graph = RTGraph('minimal.yml')
+        method = graph.methods["Useless"]
+
+        obj = RTObjectInstance("o0", graph.types["TypeOne"], {}, {}, None)
+        for i in range(1, 5000):
+            new_obj = RTObjectInstance("o" + str(i), method.outputs["optionOne"]["objectOne"].type, {}, {}, None)
+            method_instance = RTMethodInstance(method, "m" + str(i), {"objectOne": obj}, {"optionOne": {"objectOne": new_obj}})
+            new_obj.output_of = method_instance
+            obj = new_obj
+
+        obj.output_of.propagate()
+        obj.output_of.color_as_on_solution_path()
+
+        self.assertEqual(obj.distance_to_start, 4999)
+        self.assertEqual(obj.param_values["ValueOne"], 1337)
+        self.assertTrue(all(m.on_solution_path for m in obj.output_of.predecessor_methods()))
+
+    def test_incremental_propagation(self):
+        graph = RTGraph('minimal.yml')
+        convert = graph.methods["Convert"]
+        useless = graph.methods["Useless"]
+
+        start = RTObjectInstance("start", graph.types["TypeOne"], {}, {"ValueOne": 5}, None)
+        middle = RTObjectInstance("middle", graph.types["TypeOne"], {}, {}, None)
+        end = RTObjectInstance("end", graph.types["TypeTwo"], {}, {}, None)
+        first = RTMethodInstance(useless, "m1", {"objectOne": start}, {"optionOne": {"objectOne": middle}})
+        middle.output_of = first
+        second = RTMethodInstance(convert, "m2", {"in": middle}, {"optionOne": {"out": end}})
+        end.output_of = second
+
+        self.assertTrue(first.is_outdated())
+        second.propagate()
+        self.assertFalse(first.is_outdated())
+        self.assertFalse(second.is_outdated())
+        self.assertEqual(end.param_values["ValueTwo"], 1337)
+
+        # up to date predecessors are not calculated again
+        self.assertListEqual(second.predecessor_methods(outdated_only=True), [])
+        middle_version = middle.version
+        second.propagate()
+        self.assertEqual(middle.version, middle_version)
+
+        # an invalidated upstream method is recalculated and the change is noticed downstream
+        first.invalidate()
+        self.assertListEqual(second.predecessor_methods(outdated_only=True), [first])
+        second.propagate()
+        self.assertEqual(middle.version, middle_version + 1)
+        self.assertFalse(second.is_outdated())
+
+    def test_invalidation_propagates_down_the_chain(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            graph = load_cost_graph(tmp_dir, COPY_GRAPH_YML)
+        copy = graph.methods["Copy"]
+        type_t = graph.types["T"]
+
+        start = RTObjectInstance("start", type_t, {}, {"P": 1}, None)
+        objects = [start]
+        chain = []
+        for name in ("a", "b", "c"):
+            output = RTObjectInstance(name, type_t, {}, {}, None)
+            chain.append(RTMethodInstance(copy, "m_" + name, {"x": objects[-1]}, {"optionOne": {"x": output}}))
+            output.output_of = chain[-1]
+            objects.append(output)
+        first, _, last = chain
+
+        last.propagate()
+        self.assertEqual(objects[-1].param_values["P"], 1)
+
+        # the method in the middle is up to date, but its input is not after the first method was invalidated
+        start.set_param_values({"P": 2})
+        first.invalidate()
+        last.propagate()
+        self.assertEqual([obj.param_values["P"] for obj in objects], [2, 2, 2, 2])
+        self.assertFalse(any(method.is_outdated() for method in chain))
+        self.assertListEqual(last.predecessor_methods(outdated_only=True), [])
+
+    def test_input_spec_matching(self):
+        graph = RTGraph('minimal.yml')
+        type_two = graph.types["TypeTwo"]
+        enum_one = graph.instantiate_param(graph.param_types["MyEnum"], "One")
+        enum_two = graph.instantiate_param(graph.param_types["MyEnum"], "Two")
+        spec = RTMethodInput(type_two, {"ValueTwo": 3, "ValueEnum": RTParamUnset()})
+
+        objects = [RTObjectInstance("o" + str(i), type_two, {}, params, None) for i, params in enumerate([
+            {"ValueTwo": 3},
+            {"ValueTwo": 3, "ValueEnum": enum_one},
+            {"ValueTwo": 4},
+            {"ValueEnum": enum_two},
+            {"ValueTwo": RTParamPlaceholder("x")},
+        ])]
+        matching = [obj.name for obj in objects if object_matches_input_spec(obj, spec)]
+        self.assertListEqual(matching, ["o0"])
+
+        # enum values and ints with the same number are different values
+        self.assertFalse(object_matches_input_spec(objects[1], RTMethodInput(type_two, {"ValueEnum": 0})))
+        self.assertTrue(object_matches_input_spec(objects[1], RTMethodInput(type_two, {"ValueEnum": enum_one})))
+
+        # the matrix gives the same result as matching one by one, also when placeholders prevent using NumPy
+        for matrix_objects in (objects[:-1], objects):
+            matrix = RTParamMatrix(matrix_objects)
+            for input_spec in [spec] + [input_spec for _, _, input_spec in graph.inputs_by_type["TypeTwo"]]:
+                expected = [obj for obj in matrix_objects if object_matches_input_spec(obj, input_spec)]
+                self.assertListEqual(matrix.matching(input_spec), expected)
+            self.assertListEqual(matrix.matching(RTMethodInput(graph.types["TypeOne"], {})), [])
+
+    def test_read_only_objects(self):
+        graph = RTGraph('minimal.yml')
+        start = RTObjectInstance("start", graph.types["TypeOne"], {}, {"ValueOne": 5}, None)
+        first = RTObjectInstance("first", graph.types["TypeOne"], {}, {}, None)
+        method = RTMethodInstance(graph.methods["Useless"], "m1", {"objectOne": start},
+                                  {"optionOne": {"objectOne": first}})
+        method.propagate()
+
+        with self.assertRaises(TypeError):
+            first.param_values["ValueOne"] = 1
+        with self.assertRaises(AttributeError):
+            first.some_attribute = 1
+
+    def test_choice_space_encoding(self):
+        encoder = RTChoiceSpaceEncoder()
+
+        def compatible(a, b):
+            a_bits, a_mask = encoder.encode(a)
+            b_bits, b_mask = encoder.encode(b)
+            return (a_bits ^ b_bits) & a_mask & b_mask == 0
+
+        good = freeze_choice_space({"m1": "optionGood"})
+        self.assertEqual(encoder.encode({}), (0, 0))
+        self.assertTrue(encoder.contains({"m1": "optionGood", "m2": "optionOne"}, good))
+        self.assertFalse(encoder.contains(good, {"m1": "optionGood", "m2": "optionOne"}))
+        self.assertTrue(compatible(good, {"m2": "optionOne"}))
+        self.assertTrue(compatible(good, {"m1": "optionGood", "m2": "optionOne"}))
+        # conflicts are found regardless of which option was encoded first
+        self.assertFalse(compatible(good, {"m1": "optionBad"}))
+        self.assertFalse(compatible({"m3": "optionOne"}, {"m2": "optionTwo", "m3": "optionTwo"}))
+
+        # frozen choice spaces keep their encoding, until they are encoded for another solution graph
+        self.assertIs(good.encoder, encoder)
+        other_encoder = RTChoiceSpaceEncoder()
+        other_encoder.encode({"m0": "optionOne"})
+        self.assertEqual(other_encoder.encode(good), (2, 2))
+        self.assertIs(good.encoder, other_encoder)
+
+    def test_input_combinations(self):
+        graph = RTGraph('minimal.yml')
+        type_one = graph.types["TypeOne"]
+
+        o1 = RTObjectInstance("o1", type_one, {}, {}, None)
+        o2 = RTObjectInstance("o2", type_one, {"m1": "optionGood"}, {}, None)
+        o3 = RTObjectInstance("o3", type_one, {"m1": "optionBad"}, {}, None)
+        o4 = RTObjectInstance("o4", type_one, {"m2": "optionOne"}, {}, None)
+
+        combinations = input_combinations({"a": [o1, o2], "b": [o3, o4]})
+        self.assertNotIsInstance(combinations, list)
+        # o2 and o3 exclude each other
+        self.assertListEqual([(c["a"].name, c["b"].name) for c in combinations],
+                             [("o1", "o3"), ("o1", "o4"), ("o2", "o4")])
+
+        self.assertListEqual(list(input_combinations({"a": [o1], "b": []})), [])
+        self.assertListEqual(list(input_combinations({})), [{}])
+
+    def test_solution_modes(self):
+        start_dict = {"start": {"type": "TypeOne", "params": {"ValueOne": 5}}}
+        target_dict = {"target": {"type": "TypeTwo"}}
+
+        def end_objects(options):
+            sol = GetSolutionGraphView.get_solution("minimal", start_dict, target_dict, options)
+            return [obj for obj in sol["objects"] if obj["is_end"]]
+
+        # TypeTwo is created by the first method, only the exhaustive search goes on to test and correct it
+        self.assertEqual(len(end_objects(None)), 1)
+        self.assertEqual(len(end_objects(RTSearchOptions(max_solutions=1))), 1)
+        self.assertGreater(len(end_objects(RTSearchOptions(exhaustive=True))), 2)
+        self.assertEqual(len(end_objects(RTSearchOptions(exhaustive=True, max_solutions=2))), 2)
+
+    def test_reachability_pruning(self):
+        graph = RTGraph('minimal.yml')
+
+        def search(options):
+            start = RTObjectInstance("start", graph.types["TypeOne"], {}, {"ValueOne": 5}, None)
+            solution_graph = RTSolutionGraph([start], RTMethodInput(graph.types["TypeTwo"], {}))
+            flood_fill(solution_graph, graph, {}, [start], options)
+            return solution_graph
+
+        unpruned = search(RTSearchOptions(exhaustive=True, prune_unreachable=False))
+        for options in (RTSearchOptions(exhaustive=True), RTSearchOptions(exhaustive=True, bidirectional=True)):
+            pruned = search(options)
+            # Combine only leads to TypeThree, so it is never instantiated
+            self.assertNotIn("Combine", [method.method.name for method in pruned.method_instances.values()])
+            self.assertLess(len(pruned.method_instances), len(unpruned.method_instances))
+            self.assertListEqual([dict(obj.param_values) for obj in pruned.end_objects],
+                                 [dict(obj.param_values) for obj in unpruned.end_objects])
+
+    def test_best_first_search(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            graph = load_cost_graph(tmp_dir)
+
+        def search(fill):
+            start = RTObjectInstance("start", graph.types["Start"], {}, {}, None)
+            solution_graph = RTSolutionGraph([start], RTMethodInput(graph.types["Goal"], {}))
+            fill(solution_graph, graph, {}, [start], RTSearchOptions())
+            solution_graph.prune()
+            return sorted(method.method.name for method in solution_graph.method_instances.values())
+
+        # the flood stops at the fewest methods, the best first search at the cheapest chain
+        self.assertListEqual(search(flood_fill), ["Direct"])
+        self.assertListEqual(search(best_first_fill), ["FirstStep", "SecondStep"])
+
+        # an ancestor shared by several inputs is paid for once
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            graph = load_cost_graph(tmp_dir, SHARED_COST_GRAPH_YML)
+        self.assertListEqual(search(flood_fill), ["Direct"])
+        self.assertListEqual(search(best_first_fill), ["Expensive", "Join", "ToLeft", "ToRight"])
+
+        start_dict = {"start": {"type": "TypeOne", "params": {"ValueOne": 5}}}
+        target_dict = {"target": {"type": "TypeThree"}}
+        options = GetSolutionGraphView.search_options_from_json({"strategy": "best_first"})
+        sol = GetSolutionGraphView.get_solution("minimal", start_dict, target_dict, options, use_cache=False)
+        flood_sol = GetSolutionGraphView.get_solution("minimal", start_dict, target_dict, use_cache=False)
+        self.assertEqual(len(sol["methods"]), len(flood_sol["methods"]))
+        self.assertTrue(any(obj["is_end"] for obj in sol["objects"]))
+
+        with self.assertRaises(AssertionError):
+            GetSolutionGraphView.search_options_from_json({"strategy": "random"})
+
+    def test_output_type_without_input_param(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            graph = load_cost_graph(tmp_dir, RENAME_GRAPH_YML)
+
+        start = RTObjectInstance("start", graph.types["A"], {}, {"P": 3}, None)
+        solution_graph = RTSolutionGraph([start], RTMethodInput(graph.types["B"], {}))
+        flood_fill(solution_graph, graph, {}, [start], RTSearchOptions())
+        self.assertEqual(len(solution_graph.end_objects), 1)
+        end_object = solution_graph.end_objects[0]
+        self.assertEqual(end_object.type.name, "B")
+        self.assertEqual(end_object.param_mask, 0)
+
+    def test_parallel_branches(self):
+        graph = RTGraph('minimal.yml')
+
+        def search(workers, **kwargs):
+            start = RTObjectInstance("start", graph.types["TypeOne"], {}, {"ValueOne": 5}, None)
+            solution_graph = RTSolutionGraph([start], RTMethodInput(graph.types["TypeThree"], {}))
+            flood_fill(solution_graph, graph, {}, [start], RTSearchOptions(workers=workers, **kwargs))
+            return solution_graph
+
+        def summary(solution_graph):
+            return sorted((method.method.name, method.on_solution_path)
+                          for method in solution_graph.method_instances.values())
+
+        for kwargs in ({}, {"exhaustive": True}):
+            serial = search(1, **kwargs)
+            parallel = search(2, **kwargs)
+            # TestProperty branches the search, both branches are merged back
+            self.assertEqual(summary(parallel), summary(serial))
+            self.assertEqual(len(parallel.end_objects), len(serial.end_objects))
+            for method in parallel.method_instances.values():
+                self.assertFalse(method.is_outdated())
+                for output_obj in method.output_objects():
+                    self.assertIs(parallel.object_instances[output_obj.name], output_obj)
+                    self.assertTrue(set(output_obj.choice_space) <= set(parallel.method_instances))
+
+            # names do not depend on the number of workers
+            self.assertListEqual(list(search(3, **kwargs).object_instances), list(parallel.object_instances))
+
+        parallel = search(2, max_solutions=1)
+        self.assertEqual(len(parallel.end_objects), 1)
+
+        # the limits hold for all branches together
+        for max_method_instances in range(1, 12):
+            parallel = search(2, exhaustive=True, budget=RTSearchBudget(max_method_instances=max_method_instances))
+            self.assertLessEqual(len(parallel.method_instances), max_method_instances)
+            self.assertEqual(parallel.partial_reason, 'max_method_instances')
+
+    def test_cancel_slots(self):
+        cancel_slots = RTCancelSlots(n_slots=1)
+        init_cancel_tokens(cancel_slots.tokens)  # as in a pool process
+        slot = cancel_slots.acquire()
+        self.assertIsNone(cancel_slots.acquire())
+        flag = RTCancelFlag(*slot)
+        self.assertFalse(flag.is_set())
+
+        # releasing the slot stops the branches, also once the slot is used by the next search
+        cancel_slots.release(slot)
+        self.assertTrue(flag.is_set())
+        next_slot = cancel_slots.acquire()
+        self.assertTrue(flag.is_set())
+        self.assertFalse(RTCancelFlag(*next_slot).is_set())
+
+    def test_graph_pickling(self):
+        graph = RTGraph('minimal.yml')
+        start = RTObjectInstance("start", graph.types["TypeTwo"], {"m1": "optionGood"},
+                                 {"ValueEnum": graph.instantiate_param(graph.param_types["MyEnum"], "One")}, None)
+
+        copied = loads_with_graph(dumps_with_graph(start, graph), graph)
+        self.assertIs(copied.type, graph.types["TypeTwo"])
+        self.assertIs(type(copied.param_values), RTFrozenDict)
+        self.assertDictEqual(copied.param_values, start.param_values)
+        self.assertDictEqual(copied.choice_space, start.choice_space)
+
+        # known objects are referenced instead of copied
+        self.assertIs(loads_with_graph(dumps_with_graph([start], graph, {"start": start}), graph, {"start": start})[0],
+                      start)
+
+    def test_search_budget(self):
+        start_dict = {"start": {"type": "TypeOne", "params": {"ValueOne": 5}}}
+        target_dict = {"target": {"type": "TypeThree"}}
+
+        sol = GetSolutionGraphView.get_solution("minimal", start_dict, target_dict)
+        self.assertFalse(sol["partial"])
+
+        options = RTSearchOptions(budget=RTSearchBudget(max_method_instances=2))
+        sol = GetSolutionGraphView.get_solution("minimal", start_dict, target_dict, options)
+        self.assertTrue(sol["partial"])
+        self.assertEqual(sol["partial_reason"], "max_method_instances")
+        self.assertFalse(any(obj["is_end"] for obj in sol["objects"]))
+
+        cancel_event = threading.Event()
+        cancel_event.set()
+        options = RTSearchOptions(budget=RTSearchBudget(cancel_event=cancel_event))
+        sol = GetSolutionGraphView.get_solution("minimal", start_dict, target_dict, options, use_cache=False)
+        self.assertEqual(sol["partial_reason"], "cancelled")
+
+        options = RTSearchOptions(budget=RTSearchBudget(max_depth=0))
+        sol = GetSolutionGraphView.get_solution("minimal", start_dict, target_dict, options)
+        self.assertEqual(sol["partial_reason"], "max_depth")
+
+    @override_settings(SOLUTION_SEARCH_LIMITS={'max_method_instances': 100, 'max_objects': None, 'max_depth': 10, 'timeout': 5.0})
+    def test_search_budget_caps(self):
+        budget = GetSolutionGraphView.search_budget_from_json({'max_method_instances': 1000, 'max_objects': 7, 'timeout': 1})
+        self.assertEqual(budget.max_method_instances, 100)
+        self.assertEqual(budget.max_objects, 7)
+        self.assertEqual(budget.max_depth, 10)
+        self.assertEqual(budget.timeout, 1)
+
+        with self.assertRaises(AssertionError):
+            GetSolutionGraphView.search_budget_from_json({'max_steps': 1})
+        for limits in ({'max_objects': True}, {'timeout': False}, {'max_depth': 2.5}, {'max_method_instances': 10.0},
+                       {'max_objects': 0}):
+            with self.assertRaises(AssertionError):
+                GetSolutionGraphView.search_budget_from_json(limits)
+        self.assertEqual(GetSolutionGraphView.search_budget_from_json({'timeout': 0.5}).timeout, 0.5)
+
+
+class SolutionCacheTest(TestCase):
+    @override_settings(SOLUTION_CACHE={'BACKEND': 'ackbas_core.solution_cache.RTLocalSolutionCache'})
+    def test_cached_solution(self):
+        start_dict = {"start": {"type": "TypeOne", "params": {"ValueOne": 5}}}
+        target_dict = {"target": {"type": "TypeThree"}}
+
+        sol = GetSolutionGraphView.get_solution("minimal", start_dict, target_dict)
+        # same query with different key order is served from the cache
+        reordered_start_dict = {"start": {"params": {"ValueOne": 5}, "type": "TypeOne"}}
+        cached_sol = GetSolutionGraphView.get_solution("minimal", reordered_start_dict, target_dict)
+
+        self.assertEqual(cached_sol, sol)
+        self.assertEqual(get_solution_cache().stats()['hits'], 1)
+        self.assertEqual(get_solution_cache().stats()['misses'], 1)
+
+        # different search settings are a different query
+        GetSolutionGraphView.get_solution("minimal", start_dict, target_dict, RTSearchOptions(exhaustive=True))
+        self.assertEqual(get_solution_cache().stats()['misses'], 2)
+
+    def test_graph_change_evicts(self):
+        cache = RTLocalSolutionCache(max_size=2)
+        cache.set("graph", "hash1", "query1", {"objects": []})
+        cache.set("other", "hash1", "query1", {"objects": []})
+        self.assertIsNotNone(cache.get("graph", "hash1", "query1"))
+
+        # a new hash for the graph drops its old results, other graphs are kept
+        self.assertIsNone(cache.get("graph", "hash2", "query1"))
+        self.assertEqual(cache.stats()['size'], 1)
+        self.assertIsNotNone(cache.get("other", "hash1", "query1"))
+
+
+class SolverPoolTest(TestCase):
+    def test_saturation_and_timeout(self):
+        pool = RTSolverPool(workers=1, max_queue=0, timeout=0.2)
+
+        async def run_searches():
+            slow_search = asyncio.ensure_future(pool.run(time.sleep, 0.5))
+            await asyncio.sleep(0)  # let the slow search take the only worker
+
+            with self.assertRaises(RTSolverPoolSaturated):
+                await pool.run(time.sleep, 0)
+            with self.assertRaises(asyncio.TimeoutError):
+                await slow_search
+
+        try:
+            asyncio.run(run_searches())
+            self.assertEqual(pool.stats()['rejected'], 1)
+            self.assertEqual(pool.stats()['timed_out'], 1)
+            # the worker stays taken until the slow search is actually done
+            self.assertEqual(pool.stats()['in_flight'], 1)
+            time.sleep(0.5)
+            self.assertEqual(pool.stats()['in_flight'], 0)
+        finally:
+            pool.shutdown()
+
+    def test_worker_died(self):
+        pool = RTSolverPool(workers=1, max_queue=1, timeout=10.0)
+
+        async def run_searches():
+            with self.assertRaises(BrokenProcessPool):
+                await pool.run(os._exit, 1)
+            # new processes are started for the next call
+            return await pool.run(abs, -1)
+
+        try:
+            self.assertEqual(asyncio.run(run_searches()), 1)
+            self.assertEqual(pool.stats()['in_flight'], 0)
+            self.assertEqual(pool.stats()['completed'], 1)
+        finally:
+            pool.shutdown()
+
+    def test_stream(self):
+        pool = RTSolverPool(workers=1, max_queue=0, timeout=10.0)
+
+        async def read(stream):
+            return [item async for item in stream]
+
+        async def read_failing(stream):
+            items = []
+            with self.assertRaisesMessage(RTSolverStreamError, "search failed"):
+                async for item in stream:
+                    items.append(item)
+            return items
+
+        async def cancel(stream):
+            self.assertEqual(await stream.__anext__(), 'started')
+            # the only worker is taken
+            with self.assertRaises(RTSolverPoolSaturated):
+                pool.stream(send_numbers, 1)
+            stream.close()
+
+        def wait_for_worker():
+            # the end of a stream can arrive before the pool knows that the call is done
+            deadline = time.monotonic() + 5
+            while pool.stats()['in_flight'] and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(pool.stats()['in_flight'], 0)
+
+        try:
+            self.assertEqual(asyncio.run(read(pool.stream(send_numbers, 3))), [0, 1, 2])
+            wait_for_worker()
+            self.assertEqual(asyncio.run(read_failing(pool.stream(fail_after_sending))), ['started'])
+            wait_for_worker()
+
+            # closing the stream stops the call in the worker
+            asyncio.run(cancel(pool.stream(send_until_cancelled)))
+            wait_for_worker()
+            self.assertEqual(pool.stats()['streams'], 0)
+            self.assertEqual(asyncio.run(read(pool.stream(send_numbers, 1))), [0])
+        finally:
+            pool.shutdown()
+
+    @override_settings(SOLVER_POOL={'workers': 1, 'max_queue': 1, 'timeout': 30.0}, SOLUTION_CACHE=None)
+    def test_async_solution_view(self):
+        start_yml = "start:\n  type: TypeOne\n  params:\n    ValueOne: 5"
+        target_yml = "target:\n  type: TypeThree"
+        response = self.client.post('/s', json.dumps({"graph_name": "minimal", "start": start_yml, "target": target_yml}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        sol = GetSolutionGraphView.get_solution("minimal", {"start": {"type": "TypeOne", "params": {"ValueOne": 5}}},
+                                                {"target": {"type": "TypeThree"}})
+        self.assertEqual(response.json(), sol)
+
+        response = self.client.post('/s', json.dumps({"graph_name": "minimal"}), content_type='application/json')
+        self.assertEqual(response.status_code, 500)
+
+
+class SolutionBatchTest(TestCase):
+    @override_settings(SOLUTION_CACHE=None)
+    def test_batch_matches_single_queries(self):
+        start_one = {"start": {"type": "TypeOne", "params": {"ValueOne": 5}}}
+        start_two = {"start": {"type": "TypeTwo"}}
+        queries = [(start, {"target": {"type": type_name}}) for start in (start_one, start_two)
+                   for type_name in ("TypeOne", "TypeTwo", "TypeThree", "TypeWithoutParams")]
+        options = RTSearchOptions(exhaustive=True)
+        results = GetSolutionGraphView.get_solution_batch("minimal", queries, options, include_graphs=True)
+        for (start_dict, target_dict), result in zip(queries, results):
+            sol = GetSolutionGraphView.get_solution("minimal", start_dict, target_dict, options)
+            self.assertEqual(result['reachable'], any(obj['is_end'] for obj in sol['objects']))
+            self.assertEqual(len(result['graph']['methods']), len(sol['methods']))
+        self.assertEqual([result['reachable'] for result in results], [True, True, True, False, False, True, False, False])
+
+        # errors only affect their own queries
+        results = GetSolutionGraphView.get_solution_batch("minimal", [
+            (start_one, {"target": {"type": "Missing"}}),
+            (start_one, {"target": {"type": "TypeThree"}}),
+            ({"start": {"type": "Missing"}}, {"target": {"type": "TypeThree"}})
+        ])
+        self.assertIn('error', results[0])
+        self.assertTrue(results[1]['reachable'])
+        self.assertNotIn('graph', results[1])
+        self.assertIn('error', results[2])
+
+    @override_settings(SOLVER_POOL={'workers': 1, 'max_queue': 1, 'timeout': 30.0})
+    def test_batch_view(self):
+        queries = [{"start": "start:\n  type: TypeOne\n  params:\n    ValueOne: 5", "target": "target:\n  type: " + type_name}
+                   for type_name in ("TypeThree", "TypeWithoutParams")]
+        response = self.client.post('/s/batch', json.dumps({"graph_name": "minimal", "queries": queries}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['reachable'] for result in response.json()['results']], [True, False])
+
+    @override_settings(SOLVER_POOL={'workers': 1, 'max_queue': 0, 'timeout': 30.0})
+    def test_batch_view_saturated(self):
+        start_one = "start:\n  type: TypeOne\n  params:\n    ValueOne: 5"
+        start_two = "start:\n  type: TypeTwo"
+        queries = [{"start": start, "target": "target:\n  type: TypeThree"} for start in (start_one, start_two, start_one)]
+        # each start is a call of the pool, they take turns on the only worker instead of overflowing the queue
+        response = self.client.post('/s/batch', json.dumps({"graph_name": "minimal", "queries": queries}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['reachable'] for result in response.json()['results']], [True, False, True])
+        self.assertEqual(get_solver_pool().stats()['rejected'], 0)
+        self.assertEqual(get_solver_pool().stats()['completed'], 2)
+
+        # nothing fits while the worker is busy
+        deadline = time.monotonic() + 5
+        while get_solver_pool().stats()['in_flight'] and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        async def post_while_busy():
+            stream = get_solver_pool().stream(send_until_cancelled)
+            try:
+                return await sync_to_async(self.client.post)('/s/batch', json.dumps(
+                    {"graph_name": "minimal", "queries": queries}), content_type='application/json')
+            finally:
+                stream.close()
+
+        response = asyncio.run(post_while_busy())
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '5')
+
+        response = self.client.post('/s/batch', json.dumps({"graph_name": "minimal", "queries": {}}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 500)
+
+
+class ClosureTest(TestCase):
+    def test_closure_index(self):
+        rtgraph = RTGraph('minimal.yml')
+        start_dict = {"start": {"type": "TypeOne", "params": {"ValueOne": 5}}}
+        start_objects = GetSolutionGraphView.start_objects_from_dict(rtgraph, start_dict)
+        closure = search_closure(rtgraph, start_objects)
+        self.assertIsNone(closure.solution_graph.partial_reason)
+
+        for witness in closure.witnesses.values():
+            # every method only uses start objects and outputs of the methods before it
+            available = set(start_objects)
+            for method_instance in witness.methods:
+                self.assertTrue(all(input_obj is None or input_obj in available
+                                    for input_obj in method_instance.inputs.values()))
+                available.update(method_instance.output_objects())
+            if witness.methods:
+                self.assertIs(witness.obj.output_of, witness.methods[-1])
+            else:
+                self.assertTrue(witness.obj.is_start)
+
+        type_names = ["TypeOne", "TypeTwo", "TypeThree", "TypeWithoutParams"]
+        batch = GetSolutionGraphView.get_solution_batch("minimal", [(start_dict, {"target": {"type": type_name}})
+                                                                    for type_name in type_names])
+        for type_name, result in zip(type_names, batch):
+            witnesses = closure.lookup(GetSolutionGraphView.target_spec_from_dict(rtgraph, {"target": {"type": type_name}}))
+            self.assertEqual(bool(witnesses), result['reachable'])
+            self.assertTrue(all(witness.obj.type.name == type_name for witness in witnesses))
+
+    @override_settings(SOLVER_POOL={'workers': 1, 'max_queue': 1, 'timeout': 30.0})
+    def test_closure_view(self):
+        start_yml = "start:\n  type: TypeOne\n  params:\n    ValueOne: 5"
+        response = self.client.post('/s/closure', json.dumps({"graph_name": "minimal", "start": start_yml}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        signatures = response.json()['signatures']
+        self.assertEqual(signatures[0]['name'], 'start')
+        self.assertEqual(signatures[0]['witness'], [])
+        self.assertIn('TypeThree', [signature['type'] for signature in signatures])
+        self.assertEqual(signatures, GetSolutionGraphView.get_closure("minimal", yaml.safe_load(start_yml))['signatures'])
+
+
+class StreamSolutionTest(TestCase):
+    @override_settings(SOLUTION_CACHE=None)
+    def test_streamed_solution(self):
+        start_yml = "start:\n  type: TypeOne\n  params:\n    ValueOne: 5"
+        target_yml = "target:\n  type: TypeThree"
+        response = self.client.post('/s/stream', json.dumps({"graph_name": "minimal", "start": start_yml,
+                                                              "target": target_yml}),
+                                    content_type='application/json')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        events = []
+        for block in b''.join(response.streaming_content).decode('utf8').split('\n\n')[:-1]:
+            event_line, data_line = block.split('\n')
+            events.append((event_line[len('event: '):], json.loads(data_line[len('data: '):])))
+        self.assertEqual(events[-1][0], 'solution')
+        waves = [data for name, data in events[:-1]]
+        self.assertTrue(waves and all(name == 'wave' for name, _ in events[:-1]))
+
+        # the waves add up to the unpruned graph, with unique ids
+        self.assertEqual(waves[0]['objects'][0]['name'], 'start')
+        ids = [obj['id'] for wave in waves for obj in wave['objects']] + \
+              [mc['id'] for wave in waves for mc in wave['methods']]
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(max(ids) + 1, waves[-1]['nextId'])
+
+        sol = GetSolutionGraphView.get_solution("minimal", {"start": {"type": "TypeOne", "params": {"ValueOne": 5}}},
+                                                {"target": {"type": "TypeThree"}})
+        self.assertEqual(events[-1][1], sol)
+
+        response = self.client.post('/s/stream', json.dumps({"graph_name": "missing", "start": start_yml,
+                                                              "target": target_yml}),
+                                    content_type='application/json')
+        self.assertEqual(b''.join(response.streaming_content).decode('utf8').split('\n')[0], 'event: error')
+
+
+class StreamSolutionASGITest(SimpleTestCase):
+    """
+    The stream view served by the ASGI handler, without the test client. No database, the handler closes the
+    connections of the test transaction at the end of a request.
+    """
+    query = json.dumps({"graph_name": "minimal", "start": "start:\n  type: TypeOne\n  params:\n    ValueOne: 5",
+                        "target": "target:\n  type: TypeThree"}).encode('utf8')
+
+    @staticmethod
+    async def post_stream(body: bytes):
+        communicator = ApplicationCommunicator(RTASGIHandler(), {
+            'type': 'http', 'method': 'POST', 'path': '/s/stream', 'query_string': b'',
+            'headers': [(b'host', b'testserver'), (b'content-type', b'application/json')]
+        })
+        await communicator.send_input({'type': 'http.request', 'body': body})
+        start = await communicator.receive_output(10)
+        chunks = []
+        while True:
+            message = await communicator.receive_output(10)
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body', False):
+                return start['status'], b''.join(chunks).decode('utf8')
+
+    @override_settings(SOLVER_POOL={'workers': 1, 'max_queue': 1, 'timeout': 30.0}, SOLUTION_CACHE=None)
+    def test_streamed_solution(self):
+        status, content = asyncio.run(self.post_stream(self.query))
+        self.assertEqual(status, 200)
+        blocks = content.split('\n\n')[:-1]
+        self.assertTrue(all(block.startswith('event: wave\n') for block in blocks[:-1]))
+        self.assertTrue(blocks[-1].startswith('event: solution\n'))
+
+        sol = GetSolutionGraphView.get_solution("minimal", {"start": {"type": "TypeOne", "params": {"ValueOne": 5}}},
+                                                {"target": {"type": "TypeThree"}})
+        self.assertEqual(json.loads(blocks[-1].split('\n')[1][len('data: '):]), sol)
+        self.assertEqual(get_solver_pool().stats()['streams'], 0)
+
+    @override_settings(SOLVER_POOL={'workers': 1, 'max_queue': 0, 'timeout': 30.0}, SOLUTION_CACHE=None)
+    def test_saturated(self):
+        async def post_while_busy():
+            stream = get_solver_pool().stream(send_until_cancelled)
+            try:
+                return await self.post_stream(self.query)
+            finally:
+                stream.close()
+
+        status, content = asyncio.run(post_while_busy())
+        self.assertEqual(status, 503)
+
+
+class SingleFlightTest(TestCase):
+    def test_coalesced_calls(self):
+        single_flight = RTSingleFlight()
+        calls = []
+        release = threading.Event()
+
+        def compute(value):
+            calls.append(value)
+            release.wait(5)
+            return {'value': value}
+
+        results = []
+        threads = [threading.Thread(target=lambda i=i: results.append(single_flight.run('key', compute, i)))
+                   for i in range(3)]
+        threads[0].start()
+        while not calls:
+            time.sleep(0.001)
+        for thread in threads[1:]:
+            thread.start()
+        while single_flight.stats()['coalesced'] < 2:
+            time.sleep(0.001)
+        self.assertEqual(single_flight.waiter_counts(), {'key': {'waiting': 2, 'total': 2}})
+
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(calls, [0])
+        self.assertEqual(results, [{'value': 0}] * 3)
+        self.assertEqual(single_flight.stats(), {'in_flight': 0, 'leaders': 1, 'coalesced': 2})
+        self.assertEqual(single_flight.waiter_counts(), {'key': {'waiting': 0, 'total': 2}})
+
+        # a finished computation is not reused
+        self.assertEqual(single_flight.run('key', compute, 3), {'value': 3})
+
+    def test_coalesced_coroutines(self):
+        single_flight = RTSingleFlight()
+        calls = []
+
+        async def compute(value):
+            calls.append(value)
+            await asyncio.sleep(0.01)
+            if value < 0:
+                raise ValueError(value)
+            return value
+
+        async def query():
+            results = await asyncio.gather(single_flight.run_async('a', compute, 1),
+                                           single_flight.run_async('a', compute, 2),
+                                           single_flight.run_async('b', compute, 3))
+            errors = await asyncio.gather(single_flight.run_async('c', compute, -1),
+                                          single_flight.run_async('c', compute, -2), return_exceptions=True)
+            return results, errors
+
+        results, errors = asyncio.run(query())
+        self.assertEqual(results, [1, 1, 3])
+        self.assertEqual([str(e) for e in errors], ['-1', '-1'])
+        self.assertEqual(calls, [1, 3, -1])
+        self.assertEqual(single_flight.stats()['coalesced'], 2)
@@ -3,7 +3,7 @@ import "bootstrap";
 import "bootstrap/dist/css/bootstrap.min.css";
 import * as monaco from "monaco-editor"
 import $ from "jquery";
-import {Port, KnowledgeGraphData, SolutionGraphData, fetchKnowledgeGraph, fetchSolutionGraph} from "./methodnet_data";
+import {Port, KnowledgeGraphData, SolutionGraphData, fetchKnowledgeGraph, streamSolutionGraph} from "./methodnet_data";
 import {
     getKnowledgeNodePositions,
     getSolutionNodePositions,
@@ -73,8 +73,11 @@ async function update() {
     let targetYML = targetEditor.getValue()
 
     try {
-        let graphData = await fetchSolutionGraph(graphName, startYML, targetYML)
+        // show the objects found so far while the search is running
+        let graphData = await streamSolutionGraph(graphName, startYML, targetYML, setSolutionGraphData)
         setSolutionGraphData(graphData)
+        if (graphData.partial)
+            showError(`Search stopped early (${graphData.partial_reason}), the solution graph may be incomplete`)
     } catch (e) {
         // Display errors returned by server in error popup
         let error_text: string = await e.text()
@@ -30,6 +30,8 @@ export interface SolutionGraphData {
         toId: number
     }[]
     nextId: number  // next unused id. successive ids can be assigned freely locally
+    partial: boolean  // search was stopped by a limit before completion
+    partial_reason: string | null  // name of the exhausted limit
 }
 
 /** Data structure received by server containing a knowledge graph */
@@ -68,3 +70,58 @@ export async function fetchSolutionGraph(graphName: string, startYML: string, ta
         throw response;  // Will be caught displayed as an error popup
     return await response.json() as SolutionGraphData;
 }
+
+/** Like fetchSolutionGraph, but calls onWave with the unpruned solution graph found so far after every wave of the
+ * search. Resolves to the final, pruned solution graph. */
+export async function streamSolutionGraph(graphName: string, startYML: string, targetYML: string,
+                                          onWave: (graphData: SolutionGraphData) => void): Promise<SolutionGraphData> {
+    let response = await fetch('/s/stream', {
+        method: "POST",
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({
+            "graph_name": graphName,
+            "start": startYML,
+            "target": targetYML
+        })
+    })
+
+    if (!response.ok)
+        throw response;  // Will be caught displayed as an error popup
+
+    // waves only contain new nodes, ids are unique over the whole stream
+    let graphData: SolutionGraphData = {
+        methods: [], objects: [], connections: [], nextId: 0, partial: false, partial_reason: null
+    }
+    let reader = response.body.getReader()
+    let decoder = new TextDecoder()
+    let buffer = ''
+    while (true) {
+        let {done, value} = await reader.read()
+        if (done)
+            break
+        buffer += decoder.decode(value, {stream: true})
+
+        // server-sent events are separated by an empty line
+        let events = buffer.split('\n\n')
+        buffer = events.pop()
+        for (let event of events) {
+            let name = event.match(/^event: (.*)$/m)[1]
+            let data = JSON.parse(event.match(/^data: (.*)$/m)[1])
+            if (name == 'wave') {
+                graphData.methods.push(...data.methods)
+                graphData.objects.push(...data.objects)
+                graphData.connections.push(...data.connections)
+                graphData.nextId = data.nextId
+                onWave(graphData)
+            } else if (name == 'solution') {
+                return data as SolutionGraphData
+            } else if (name == 'error') {
+                throw new Response(data)  // displayed like an error response of fetchSolutionGraph
+            }
+        }
+    }
+
+    throw new Response("The solution stream ended without a solution")
+}
@@ -161,7 +161,7 @@ export function setSolutionGraphData(graphData: SolutionGraphData) {
     let H_SPACE = 500  // Horizontal space between fixed nodes
     let V_SPACE = 250  // Mean vertical space between nodes on longest path from start to end
 
-    let maxDistanceToStart = graphData.objects.filter(value => value.is_end).map(value => value.distance_to_start).reduce((a, b) => Math.max(a,b))
+    let maxDistanceToStart = graphData.objects.filter(value => value.is_end).map(value => value.distance_to_start).reduce((a, b) => Math.max(a,b), 0)
 
     function makeObjectNode(objectData) {
         let newNode: vis.Node = {
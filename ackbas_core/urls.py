@@ -5,7 +5,10 @@ from . import views
 urlpatterns = [
   url(r'^$', views.LandingPageView.as_view(), name='landing-page'),
   path('g/<slug:graph>', views.GraphEditorView.as_view(), name='graph-editor'),
-  path('s', views.GetSolutionGraphView.as_view(), name='get-solution'),
+  path('s', views.AsyncGetSolutionGraphView.as_view(), name='get-solution'),
+  path('s/batch', views.AsyncGetSolutionBatchView.as_view(), name='get-solution-batch'),
+  path('s/closure', views.AsyncGetClosureView.as_view(), name='get-closure'),
+  path('s/stream', views.StreamSolutionGraphView.as_view(), name='stream-solution'),
   path('kg/<slug:graph_name>', views.GetKnowledgeGraphView.as_view(), name='get-knowledge-graph')
 ]
 
@@ -1,13 +1,25 @@
+import asyncio
 import json
-from typing import Dict
+from dataclasses import replace
+from typing import Dict, Optional, Tuple, List, Iterable, Awaitable, AsyncGenerator
 
 import yaml
-from django.http import JsonResponse, HttpResponseServerError
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse, HttpResponse, HttpResponseServerError, HttpResponseNotAllowed
 from django.template.response import TemplateResponse
 from django.views import View
 
 import ackbas_core.knowledge_graph as kg
-from ackbas_core.solution_sketch import RTObjectInstance, RTSolutionGraph, flood_fill
+from ackbas_core.solution_cache import get_solution_cache, query_key, is_cacheable
+from ackbas_core.async_streaming import RTAsyncStreamingHttpResponse
+from ackbas_core.solver_pool import get_solver_pool, RTSolverPoolSaturated, RTSolverStream, RTStreamChannel
+from ackbas_core.single_flight import get_single_flight
+from ackbas_core.solution_sketch import RTObjectInstance, RTMethodInstance, RTSolutionGraph, RTSearchOptions, \
+    RTSearchBudget, SEARCH_STRATEGIES, search_targets, search_closure
+
+# limits of RTSearchBudget in seconds, all other limits count objects, methods or branchings
+DURATION_LIMITS = ('timeout',)
 
 
 class LandingPageView(View):
@@ -37,25 +49,198 @@ class GetSolutionGraphView(View):
             graph_name = request_json['graph_name']
             start_dict = yaml.safe_load(request_json['start'])
             target_dict = yaml.safe_load(request_json['target'])
+            options = GetSolutionGraphView.search_options_from_json(request_json)
 
-            response_dict = GetSolutionGraphView.get_solution(graph_name, start_dict, target_dict)
+            response_dict = GetSolutionGraphView.get_solution(graph_name, start_dict, target_dict, options)
 
             return JsonResponse(response_dict)
         except Exception as e:
             return HttpResponseServerError(str(e))
 
     @staticmethod
-    def get_solution(graph_name: str, start_dict: Dict, target_dict: Dict) -> Dict:
+    def search_options_from_json(request_json: Dict) -> RTSearchOptions:
+        """
+        Read the optional search settings of a request, by default each branch stops at its first solution
+        """
+        exhaustive = request_json.get('exhaustive', False)
+        assert isinstance(exhaustive, bool), "'exhaustive' must be true or false"
+        max_solutions = request_json.get('max_solutions', None)
+        assert max_solutions is None or (isinstance(max_solutions, int) and max_solutions > 0), \
+            "'max_solutions' must be a positive integer"
+        bidirectional = request_json.get('bidirectional', False)
+        assert isinstance(bidirectional, bool), "'bidirectional' must be true or false"
+        strategy = request_json.get('strategy', 'flood')
+        assert strategy in SEARCH_STRATEGIES, f"'strategy' must be one of {', '.join(SEARCH_STRATEGIES)}"
+
+        return RTSearchOptions(strategy=strategy, exhaustive=exhaustive, max_solutions=max_solutions,
+                               bidirectional=bidirectional, workers=settings.SOLUTION_SEARCH_WORKERS,
+                               budget=GetSolutionGraphView.search_budget_from_json(request_json.get('limits', {})))
 
-        graph_data = {
-            'methods': [],
-            'objects': [],
-            'connections': [],
-            'nextId': 0
+    @staticmethod
+    def search_budget_from_json(limits_dict: Dict) -> RTSearchBudget:
+        """
+        Combine the limits requested by the client with the server side caps from the settings
+        """
+        assert isinstance(limits_dict, dict), "'limits' must be an object"
+        caps = settings.SOLUTION_SEARCH_LIMITS
+        limits = {}
+        for limit_name, cap in caps.items():
+            requested = limits_dict.get(limit_name, None)
+            if requested is None:
+                limits[limit_name] = cap
+            else:
+                # bool is a subclass of int, but true is no limit
+                assert not isinstance(requested, bool), f"Limit {limit_name} must be a number, not true or false"
+                if limit_name in DURATION_LIMITS:
+                    assert isinstance(requested, (int, float)) and requested > 0, \
+                        f"Limit {limit_name} must be a positive number"
+                else:
+                    assert isinstance(requested, int) and requested > 0, f"Limit {limit_name} must be a positive integer"
+                limits[limit_name] = requested if cap is None else min(requested, cap)
+
+        unknown_limits = set(limits_dict) - set(caps)
+        assert not unknown_limits, f"Unknown limits {', '.join(sorted(unknown_limits))}"
+
+        return RTSearchBudget(**limits)
+
+    @staticmethod
+    def get_solution(graph_name: str, start_dict: Dict, target_dict: Dict, options: Optional[RTSearchOptions] = None,
+                     use_cache: bool = True) -> Dict:
+        rtgraph = kg.load_graph(graph_name + '.yml')  # load knowledge graph from disk or cache
+
+        cache = get_solution_cache() if use_cache else None
+        key = query_key(start_dict, target_dict, options)
+        if cache is not None:
+            graph_data = cache.get(graph_name, rtgraph.content_hash, key)
+            if graph_data is not None:
+                return graph_data
+
+        def compute():
+            graph_data = GetSolutionGraphView.compute_solution(rtgraph, start_dict, target_dict, options)
+            if cache is not None and is_cacheable(graph_data):
+                cache.set(graph_name, rtgraph.content_hash, key, graph_data)
+            return graph_data
+
+        # identical queries arriving while this one is searched wait for its result
+        return get_single_flight().run((rtgraph.content_hash, key), compute)
+
+    @staticmethod
+    def get_solution_batch(graph_name: str, queries: List[Tuple[Dict, Dict]], options: Optional[RTSearchOptions] = None,
+                           include_graphs: bool = False) -> List[Dict]:
+        """
+        Answer many (start, target) queries on one knowledge graph. Queries with the same start objects share one
+        exhaustive search, see search_targets, and each target is matched against its result.
+        The search strategy and solution limits of the options do not apply.
+        Returns for each query whether the target is reachable, the number of matching objects and optionally the
+        solution graph like get_solution with exhaustive search would, or the error of the query.
+        """
+        rtgraph = kg.load_graph(graph_name + '.yml')  # load knowledge graph from disk or cache
+
+        results: List[Optional[Dict]] = [None] * len(queries)
+        for indices in GetSolutionGraphView.start_groups(queries):
+            try:
+                start_objects = GetSolutionGraphView.start_objects_from_dict(rtgraph, queries[indices[0]][0])
+            except Exception as e:
+                for i in indices:
+                    results[i] = {'error': str(e)}
+                continue
+
+            target_specs = {}
+            for i in indices:
+                try:
+                    target_specs[i] = GetSolutionGraphView.target_spec_from_dict(rtgraph, queries[i][1])
+                except Exception as e:
+                    results[i] = {'error': str(e)}
+            if not target_specs:
+                continue
+
+            solution_graph = search_targets(rtgraph, start_objects, list(target_specs.values()), options)
+            for i, target_spec in target_specs.items():
+                solution_graph.retarget(target_spec)
+                results[i] = {
+                    'reachable': bool(solution_graph.end_objects),
+                    'solutions': len(solution_graph.end_objects),
+                    'partial': solution_graph.partial_reason is not None,
+                    'partial_reason': solution_graph.partial_reason
+                }
+                if include_graphs:
+                    results[i]['graph'] = GetSolutionGraphView.graph_data(solution_graph,
+                                                                          *solution_graph.solution_path())
+
+        return results
+
+    @staticmethod
+    def start_groups(queries: List[Tuple[Dict, Dict]]) -> List[List[int]]:
+        """
+        Indices of the queries with the same start objects, in the order of their first query
+        """
+        start_groups: Dict[str, List[int]] = {}
+        for i, (start_dict, target_dict) in enumerate(queries):
+            start_groups.setdefault(json.dumps(start_dict, sort_keys=True, default=str), []).append(i)
+        return list(start_groups.values())
+
+    @staticmethod
+    def get_closure(graph_name: str, start_dict: Dict, options: Optional[RTSearchOptions] = None) -> Dict:
+        """
+        Everything that can be generated from the start objects, see search_closure. Each (type, params, choice space)
+        signature is listed with the object of the shortest derivation found and the method instances of it.
+        The search strategy and solution limits of the options do not apply.
+        """
+        rtgraph = kg.load_graph(graph_name + '.yml')  # load knowledge graph from disk or cache
+
+        start_objects = GetSolutionGraphView.start_objects_from_dict(rtgraph, start_dict)
+        closure = search_closure(rtgraph, start_objects, options)
+        signatures = []
+        for witness in closure.witnesses.values():
+            signatures.append({
+                'name': witness.obj.name,
+                'type': witness.obj.type.name,
+                'params': {
+                    param_name: str(param_val) for param_name, param_val in witness.obj.param_values.items()
+                },
+                'choice_space': dict(witness.obj.choice_space),
+                'witness': [{
+                    'name': method_instance.name,
+                    'method': method_instance.method.name,
+                    'inputs': {
+                        port_name: None if input_obj is None else input_obj.name
+                        for port_name, input_obj in method_instance.inputs.items()
+                    }
+                } for method_instance in witness.methods]
+            })
+
+        return {
+            'signatures': signatures,
+            'partial': closure.solution_graph.partial_reason is not None,
+            'partial_reason': closure.solution_graph.partial_reason
         }
 
-        rtgraph = kg.RTGraph(graph_name + '.yml')  # load knowledge graph from disk
+    @staticmethod
+    def compute_solution(rtgraph: kg.RTGraph, start_dict: Dict, target_dict: Dict,
+                         options: Optional[RTSearchOptions] = None) -> Dict:
+        solution_graph, start_objects = GetSolutionGraphView.create_solution_graph(rtgraph, start_dict, target_dict)
+        # run search to find target object
+        search = SEARCH_STRATEGIES[options.strategy] if options is not None else SEARCH_STRATEGIES['flood']
+        search(solution_graph, rtgraph, {}, start_objects, options)
+        # prune all incomplete paths
+        solution_graph.prune()
+
+        return GetSolutionGraphView.graph_data(solution_graph)
 
+    @staticmethod
+    def create_solution_graph(rtgraph: kg.RTGraph, start_dict: Dict,
+                              target_dict: Dict) -> Tuple[RTSolutionGraph, List[RTObjectInstance]]:
+        """
+        Solution graph with the start objects and target spec of a query, validated against the knowledge graph
+        """
+        start_objects = GetSolutionGraphView.start_objects_from_dict(rtgraph, start_dict)
+        end_spec = GetSolutionGraphView.target_spec_from_dict(rtgraph, target_dict)
+
+        # instantiate solution graph
+        return RTSolutionGraph(start_objects, end_spec), start_objects
+
+    @staticmethod
+    def start_objects_from_dict(rtgraph: kg.RTGraph, start_dict: Dict) -> List[RTObjectInstance]:
         # instantiate and validate start objects from yaml
         start_objects = []
         for obj_name, obj_dict in start_dict.items():
@@ -71,6 +256,10 @@ class GetSolutionGraphView(View):
             obj = RTObjectInstance(obj_name, obj_type, {}, obj_params, None)
             start_objects.append(obj)
 
+        return start_objects
+
+    @staticmethod
+    def target_spec_from_dict(rtgraph: kg.RTGraph, target_dict: Dict) -> kg.RTMethodInput:
         # instantiate and validate target objects
         assert "target" in target_dict, "Target spec must contain 'target'"
         target_dict = target_dict['target']
@@ -84,23 +273,50 @@ class GetSolutionGraphView(View):
             param_instance = rtgraph.instantiate_param(param_type, param_val)
             target_params[param_name] = param_instance
 
-        end_spec = kg.RTMethodInput(target_type, target_params)
+        return kg.RTMethodInput(target_type, target_params)
 
-        # instantiate solution graph
-        solution_graph = RTSolutionGraph(start_objects, end_spec)
-        # run search to find target object
-        flood_fill(solution_graph, rtgraph, {}, start_objects)
-        # prune all incomplete paths
-        solution_graph.prune()
+    @staticmethod
+    def graph_data(solution_graph: RTSolutionGraph, objects: Optional[Iterable[RTObjectInstance]] = None,
+                   methods: Optional[Iterable[RTMethodInstance]] = None) -> Dict:
+        """
+        Data structures for the frontend, see SolutionGraphData in methodnet_data.ts.
+        By default with all objects and methods of the solution graph.
+        """
+        if objects is None:
+            objects = solution_graph.object_instances.values()
+        if methods is None:
+            methods = solution_graph.method_instances.values()
+        builder = RTGraphDataBuilder()
+        graph_data = builder.add(objects, methods)
+        graph_data['nextId'] = builder.next_id
+        graph_data['partial'] = solution_graph.partial_reason is not None
+        graph_data['partial_reason'] = solution_graph.partial_reason
 
-        # --- generate data structures for frontend ---
-        object_instances = solution_graph.object_instances
-        method_instances = solution_graph.method_instances
+        return graph_data
 
-        id = 1  # running counter for next unique id
-        ao_name_to_id: Dict[str, int] = {}  # map object names to unique id's
 
-        for ao in object_instances.values():  # build object instances
+class RTGraphDataBuilder:
+    """
+    Converts objects and methods of a solution graph to the data structures of the frontend.
+    Ids are unique over all calls of add, so a growing solution graph can be sent in parts.
+    """
+    def __init__(self):
+        self.next_id = 1  # running counter for next unique id
+        self.object_ids: Dict[str, int] = {}  # map object names to unique id's
+
+    def add(self, objects: Iterable[RTObjectInstance], methods: Iterable[RTMethodInstance]) -> Dict:
+        """
+        Data for the given objects and methods, the objects connected to the methods have to be added before
+        """
+        graph_data = {
+            'methods': [],
+            'objects': [],
+            'connections': []
+        }
+        ao_name_to_id = self.object_ids
+        id = self.next_id
+
+        for ao in objects:  # build object instances
             graph_data['objects'].append({
                 "id": id,
                 "type": ao.type.name,
@@ -116,7 +332,7 @@ class GetSolutionGraphView(View):
             ao_name_to_id[ao.name] = id
             id += 1
 
-        for mc in method_instances.values():  # build method instances
+        for mc in methods:  # build method instances
             inputs = []
             for port_name, port in mc.method.inputs.items():
                 port_dict = {
@@ -171,18 +387,284 @@ class GetSolutionGraphView(View):
             })
             id += 1
 
-        graph_data['nextId'] = id
-
+        self.next_id = id
         return graph_data
 
 
+def compute_solution_in_process(graph_name: str, start_dict: Dict, target_dict: Dict,
+                                options: Optional[RTSearchOptions]) -> Dict:
+    """
+    Run in a process of the solver pool, the knowledge graph is cached per process
+    """
+    rtgraph = kg.load_graph(graph_name + '.yml')
+    return GetSolutionGraphView.compute_solution(rtgraph, start_dict, target_dict, options)
+
+
+class AsyncGetSolutionGraphView:
+    """
+    Same as GetSolutionGraphView, but the search runs in the solver pool, so the server process stays responsive.
+    Responds with 503 if the pool is saturated or the search takes longer than the pool timeout.
+    """
+    @classmethod
+    def as_view(cls):
+        # Django only supports async function based views, subclasses of View have to be sync
+        async def view(request):
+            if request.method != 'POST':
+                return HttpResponseNotAllowed(['POST'])
+            return await cls.post(request)
+
+        return view
+
+    @staticmethod
+    async def post(request):
+        try:
+            request_json = json.loads(request.body)
+            graph_name = request_json['graph_name']
+            start_dict = yaml.safe_load(request_json['start'])
+            target_dict = yaml.safe_load(request_json['target'])
+            options = GetSolutionGraphView.search_options_from_json(request_json)
+        except Exception as e:
+            return HttpResponseServerError(str(e))
+
+        return await AsyncGetSolutionGraphView.respond(
+            AsyncGetSolutionGraphView.get_solution(graph_name, start_dict, target_dict, options))
+
+    @staticmethod
+    async def respond(solution: Awaitable[Dict]) -> HttpResponse:
+        """
+        JSON response with the result of a computation in the solver pool, or the error why there is none
+        """
+        try:
+            return JsonResponse(await solution)
+        except RTSolverPoolSaturated:
+            return AsyncGetSolutionGraphView.saturated_response()
+        except asyncio.TimeoutError:
+            return HttpResponse("The solution search took too long, please try again later", status=503)
+        except Exception as e:
+            return HttpResponseServerError(str(e))
+
+    @staticmethod
+    def saturated_response() -> HttpResponse:
+        response = HttpResponse("Too many solution searches at once, please try again later", status=503)
+        response['Retry-After'] = '5'
+        return response
+
+    @staticmethod
+    async def get_solution(graph_name: str, start_dict: Dict, target_dict: Dict,
+                           options: Optional[RTSearchOptions] = None, use_cache: bool = True) -> Dict:
+        # loading the graph and the cache may access files or the network, so keep it off the event loop
+        rtgraph = await sync_to_async(kg.load_graph, thread_sensitive=False)(graph_name + '.yml')
+        cache = get_solution_cache() if use_cache else None
+        key = query_key(start_dict, target_dict, options)
+        if cache is not None:
+            graph_data = await sync_to_async(cache.get, thread_sensitive=False)(graph_name, rtgraph.content_hash, key)
+            if graph_data is not None:
+                return graph_data
+
+        async def compute():
+            graph_data = await get_solver_pool().run(compute_solution_in_process, graph_name, start_dict, target_dict,
+                                                     options)
+            if cache is not None and is_cacheable(graph_data):
+                await sync_to_async(cache.set, thread_sensitive=False)(graph_name, rtgraph.content_hash, key,
+                                                                       graph_data)
+            return graph_data
+
+        # identical queries arriving while this one is searched wait for its result, and share a full pool or timeout
+        return await get_single_flight().run_async((rtgraph.content_hash, key), compute)
+
+
+def compute_solution_batch_in_process(graph_name: str, queries: List[Tuple[Dict, Dict]],
+                                      options: Optional[RTSearchOptions], include_graphs: bool) -> List[Dict]:
+    return GetSolutionGraphView.get_solution_batch(graph_name, queries, options, include_graphs)
+
+
+class AsyncGetSolutionBatchView(AsyncGetSolutionGraphView):
+    """
+    Answers many queries on one knowledge graph in the solver pool, see GetSolutionGraphView.get_solution_batch.
+    Takes the graph_name and search settings of /s, a list of queries with start and target YML each and optionally
+    graphs: true to include the solution graphs. The results are returned in the order of the queries.
+    The queries with the same start objects are searched as one call of the pool, each with its own timeout, so a
+    start that takes too long or does not fit into the pool only turns its own queries into errors. A batch runs at
+    most as many calls at once as the pool has workers, the queue is left to other requests. Responds with 503 if
+    none fits into the pool.
+    """
+    @staticmethod
+    async def post(request):
+        try:
+            request_json = json.loads(request.body)
+            graph_name = request_json['graph_name']
+            queries = request_json['queries']
+            assert isinstance(queries, list), "'queries' must be a list"
+            queries = [(yaml.safe_load(query['start']), yaml.safe_load(query['target'])) for query in queries]
+            include_graphs = request_json.get('graphs', False)
+            assert isinstance(include_graphs, bool), "'graphs' must be true or false"
+            options = GetSolutionGraphView.search_options_from_json(request_json)
+        except Exception as e:
+            return HttpResponseServerError(str(e))
+
+        start_groups = GetSolutionGraphView.start_groups(queries)
+        # at most one group per worker at a time, so a batch does not fill the queue of the pool by itself
+        running_groups = asyncio.Semaphore(get_solver_pool().workers)
+        group_results = await asyncio.gather(*(
+            AsyncGetSolutionBatchView.get_group_results(graph_name, [queries[i] for i in indices], options,
+                                                        include_graphs, running_groups)
+            for indices in start_groups))
+        if start_groups and all(saturated for _, saturated in group_results):
+            return AsyncGetSolutionGraphView.saturated_response()
+
+        results: List[Optional[Dict]] = [None] * len(queries)
+        for indices, (group, _) in zip(start_groups, group_results):
+            for i, result in zip(indices, group):
+                results[i] = result
+        return JsonResponse({'results': results})
+
+    @staticmethod
+    async def get_group_results(graph_name: str, queries: List[Tuple[Dict, Dict]], options: Optional[RTSearchOptions],
+                                include_graphs: bool, running_groups: asyncio.Semaphore) -> Tuple[List[Dict], bool]:
+        """
+        Results of queries with the same start objects, and whether the pool was saturated
+        """
+        try:
+            async with running_groups:
+                return await get_solver_pool().run(compute_solution_batch_in_process, graph_name, queries, options,
+                                                   include_graphs), False
+        except RTSolverPoolSaturated:
+            return [{'error': "Too many solution searches at once, please try again later"} for _ in queries], True
+        except asyncio.TimeoutError:
+            return [{'error': "The solution search took too long, please try again later"} for _ in queries], False
+        except Exception as e:
+            return [{'error': str(e)} for _ in queries], False
+
+
+def compute_closure_in_process(graph_name: str, start_dict: Dict, options: Optional[RTSearchOptions]) -> Dict:
+    return GetSolutionGraphView.get_closure(graph_name, start_dict, options)
+
+
+class AsyncGetClosureView(AsyncGetSolutionGraphView):
+    """
+    Lists everything that can be generated from the start objects, searched in the solver pool.
+    See GetSolutionGraphView.get_closure, takes the graph_name, start YML and search settings of /s.
+    """
+    @staticmethod
+    async def post(request):
+        try:
+            request_json = json.loads(request.body)
+            graph_name = request_json['graph_name']
+            start_dict = yaml.safe_load(request_json['start'])
+            options = GetSolutionGraphView.search_options_from_json(request_json)
+        except Exception as e:
+            return HttpResponseServerError(str(e))
+
+        return await AsyncGetSolutionGraphView.respond(
+            get_solver_pool().run(compute_closure_in_process, graph_name, start_dict, options))
+
+
+def stream_solution_in_process(channel: RTStreamChannel, graph_name: str, start_dict: Dict, target_dict: Dict,
+                               options: RTSearchOptions):
+    """
+    Run in a process of the solver pool, sends the events of StreamSolutionGraphView through channel as (name, data)
+    """
+    rtgraph = kg.load_graph(graph_name + '.yml')
+    solution_graph, start_objects = GetSolutionGraphView.create_solution_graph(rtgraph, start_dict, target_dict)
+    builder = RTGraphDataBuilder()
+    sent_methods = set()
+
+    def send_wave(graph: RTSolutionGraph):
+        # objects and methods are only ever added to the graph during the search, so the new ones are the unsent ones,
+        # in the order they were added
+        objects = [obj for obj in graph.object_instances.values() if obj.name not in builder.object_ids]
+        methods = [mc for mc in graph.method_instances.values() if mc.name not in sent_methods]
+        sent_methods.update(mc.name for mc in methods)
+        wave_data = builder.add(objects, methods)
+        wave_data['nextId'] = builder.next_id
+        channel.send(('wave', wave_data))
+
+    send_wave(solution_graph)
+    # the search stops once the client is gone
+    options = replace(options, progress=send_wave, budget=replace(options.budget, cancel_event=channel))
+    SEARCH_STRATEGIES[options.strategy](solution_graph, rtgraph, {}, start_objects, options)
+    solution_graph.prune()
+    channel.send(('solution', GetSolutionGraphView.graph_data(solution_graph)))
+
+
+class StreamSolutionGraphView(AsyncGetSolutionGraphView):
+    """
+    Same query as GetSolutionGraphView, answered as server-sent events: a 'wave' event with the new objects and
+    methods after every wave of the search and a final 'solution' event with the pruned graph, like /s returns it.
+    Errors end the stream with an 'error' event.
+    The search runs in the solver pool like for /s and is rejected with 503 if the pool is saturated. Served by
+    RTASGIHandler, the events are sent without blocking the event loop and the search stops when the client
+    disconnects.
+    """
+    @staticmethod
+    async def post(request):
+        try:
+            request_json = json.loads(request.body)
+            graph_name = request_json['graph_name']
+            start_dict = yaml.safe_load(request_json['start'])
+            target_dict = yaml.safe_load(request_json['target'])
+            options = GetSolutionGraphView.search_options_from_json(request_json)
+        except Exception as e:
+            return HttpResponseServerError(str(e))
+
+        stream = None
+        try:
+            rtgraph = await sync_to_async(kg.load_graph, thread_sensitive=False)(graph_name + '.yml')
+            cache = get_solution_cache()
+            key = query_key(start_dict, target_dict, options)
+            graph_data = None if cache is None else \
+                await sync_to_async(cache.get, thread_sensitive=False)(graph_name, rtgraph.content_hash, key)
+            if graph_data is None:
+                stream = get_solver_pool().stream(stream_solution_in_process, graph_name, start_dict, target_dict,
+                                                  options)
+        except RTSolverPoolSaturated:
+            return AsyncGetSolutionGraphView.saturated_response()
+        except Exception as e:
+            events = StreamSolutionGraphView.error_events(str(e))
+        else:
+            events = StreamSolutionGraphView.events(stream, graph_data, cache, graph_name, rtgraph.content_hash, key)
+
+        response = RTAsyncStreamingHttpResponse(events, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # keep proxies like nginx from collecting the events
+        return response
+
+    @staticmethod
+    async def events(stream: Optional[RTSolverStream], graph_data: Optional[Dict], cache, graph_name: str,
+                     content_hash: str, key: str) -> AsyncGenerator[str, None]:
+        if stream is None:
+            yield StreamSolutionGraphView.event('solution', graph_data)
+            return
+
+        try:
+            async for name, data in stream:
+                if name == 'solution' and cache is not None and is_cacheable(data):
+                    await sync_to_async(cache.set, thread_sensitive=False)(graph_name, content_hash, key, data)
+                yield StreamSolutionGraphView.event(name, data)
+        except asyncio.TimeoutError:
+            yield StreamSolutionGraphView.event('error', "The solution search took too long, please try again later")
+        except Exception as e:
+            yield StreamSolutionGraphView.event('error', str(e))
+        finally:
+            # the client went away before the end of the stream
+            stream.close()
+
+    @staticmethod
+    async def error_events(message: str) -> AsyncGenerator[str, None]:
+        yield StreamSolutionGraphView.event('error', message)
+
+    @staticmethod
+    def event(name: str, data) -> str:
+        return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+
 class GetKnowledgeGraphView(View):
     @staticmethod
     def get(request, graph_name):
         """
         Return knowledge graph data for specified file name
         """
-        rtgraph = kg.RTGraph(graph_name + '.yml')
+        rtgraph = kg.load_graph(graph_name + '.yml')
 
         # build type instances
         types = [{